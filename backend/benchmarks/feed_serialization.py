@@ -0,0 +1,109 @@
+"""
+Benchmark: per-request CPU spent encoding a 20-post feed page
+Compares the old serialize -> json.dumps -> json.loads -> JSONResponse path
+with the single-pass MongoJSONResponse.
+
+Run from the backend directory: python benchmarks/feed_serialization.py
+"""
+from datetime import datetime, timedelta
+from pathlib import Path
+import json
+import sys
+import timeit
+import uuid
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+import fast_json
+from fast_json import MongoJSONResponse
+
+
+class LegacyJSONEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, ObjectId):
+            return str(obj)
+        elif isinstance(obj, datetime):
+            return obj.isoformat()
+        return super().default(obj)
+
+
+def legacy_serialize_object_ids(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    elif isinstance(obj, datetime):
+        return obj.isoformat()
+    elif isinstance(obj, dict):
+        return {k: legacy_serialize_object_ids(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [legacy_serialize_object_ids(item) for item in obj]
+    return obj
+
+
+def build_page(posts=20, comments_per_post=3):
+    now = datetime.utcnow()
+    page = []
+    for i in range(posts):
+        created_at = now - timedelta(minutes=i)
+        page.append({
+            "_id": ObjectId(),
+            "id": str(uuid.uuid4()),
+            "user_id": str(uuid.uuid4()),
+            "content": "Looking for a study group for Data Structures before the internal exam " * 3,
+            "image": f"/api/media/{uuid.uuid4().hex * 2}",
+            "tags": ["exam", "dsa", "studygroup"],
+            "likes_count": 42,
+            "comments_count": 7,
+            "shares_count": 1,
+            "created_at": created_at,
+            "updated_at": created_at,
+            "user": {
+                "id": str(uuid.uuid4()),
+                "name": "Arjun Kumar",
+                "department": "CSE",
+                "year": 3,
+                "profile_image": f"/api/media/{uuid.uuid4().hex * 2}",
+            },
+            "is_liked": i % 2 == 0,
+            "is_bookmarked": i % 5 == 0,
+            "comments": [
+                {
+                    "id": str(uuid.uuid4()),
+                    "content": "Count me in! 🙌",
+                    "created_at": created_at + timedelta(seconds=j),
+                    "user": {"name": "Priya", "department": "ECE", "year": 2},
+                }
+                for j in range(comments_per_post)
+            ],
+        })
+    return page
+
+
+def legacy_render(page):
+    posts = legacy_serialize_object_ids(page)
+    return JSONResponse(content=json.loads(json.dumps(posts, cls=LegacyJSONEncoder))).body
+
+
+def fast_render(page):
+    return MongoJSONResponse(content=page).body
+
+
+def main(number=2000, repeat=5):
+    page = build_page()
+    assert json.loads(legacy_render(page)) == json.loads(fast_render(page))
+
+    engine = "orjson" if fast_json.orjson is not None else "stdlib json"
+    results = {}
+    for name, render in (("legacy round trip", legacy_render), (f"single pass ({engine})", fast_render)):
+        best = min(timeit.repeat(lambda: render(page), number=number, repeat=repeat))
+        results[name] = best / number * 1e6
+        print(f"{name:>28}: {results[name]:8.1f} µs per 20-post page")
+
+    legacy, fast = results.values()
+    print(f"{'saved':>28}: {legacy - fast:8.1f} µs per request ({legacy / fast:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
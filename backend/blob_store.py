@@ -0,0 +1,138 @@
+"""
+Content-addressed blob storage for uploaded images
+Blobs are keyed by the SHA-256 of their bytes, so identical uploads are stored once
+"""
+from pathlib import Path
+from typing import AsyncIterator, Optional
+import asyncio
+import hashlib
+import json
+import os
+import re
+import uuid
+
+from pymongo.errors import DuplicateKeyError
+
+CHUNK_SIZE = 64 * 1024
+
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def blob_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def is_valid_digest(digest: str) -> bool:
+    return bool(DIGEST_PATTERN.match(digest))
+
+
+class BlobInfo:
+    def __init__(self, digest: str, size: int, content_type: str):
+        self.digest = digest
+        self.size = size
+        self.content_type = content_type
+
+
+class FilesystemBlobStore:
+    """Stores each blob as <root>/<aa>/<bb>/<digest> with a small JSON metadata sidecar"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def _path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def _write(self, digest: str, data: bytes, content_type: str):
+        path = self._path(digest)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temporary name first so readers never see a partial blob
+        meta_path = path.with_suffix(".json")
+        tmp_suffix = f".{uuid.uuid4().hex}.tmp"
+        tmp_meta = meta_path.with_name(meta_path.name + tmp_suffix)
+        tmp_meta.write_text(json.dumps({"size": len(data), "content_type": content_type}))
+        os.replace(tmp_meta, meta_path)
+        tmp_path = path.with_name(path.name + tmp_suffix)
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    def _stat(self, digest: str) -> Optional[BlobInfo]:
+        path = self._path(digest)
+        if not path.exists():
+            return None
+        meta = json.loads(path.with_suffix(".json").read_text())
+        return BlobInfo(digest, meta["size"], meta["content_type"])
+
+    def _read(self, digest: str, offset: int, length: int) -> bytes:
+        with open(self._path(digest), "rb") as blob:
+            blob.seek(offset)
+            return blob.read(length)
+
+    async def put(self, data: bytes, content_type: str) -> str:
+        digest = blob_digest(data)
+        await asyncio.to_thread(self._write, digest, data, content_type)
+        return digest
+
+    async def stat(self, digest: str) -> Optional[BlobInfo]:
+        return await asyncio.to_thread(self._stat, digest)
+
+    async def stream(self, digest: str, start: int, end: int) -> AsyncIterator[bytes]:
+        """Yield bytes start..end (inclusive) in chunks"""
+        position = start
+        while position <= end:
+            chunk = await asyncio.to_thread(self._read, digest, position, min(CHUNK_SIZE, end - position + 1))
+            if not chunk:
+                break
+            position += len(chunk)
+            yield chunk
+
+
+class GridFSBlobStore:
+    """Stores blobs in a GridFS bucket, using the digest as the file _id"""
+
+    def __init__(self, database, bucket_name: str = "media"):
+        from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+        self._bucket = AsyncIOMotorGridFSBucket(database, bucket_name=bucket_name, chunk_size_bytes=255 * 1024)
+        self._files = database[f"{bucket_name}.files"]
+
+    async def put(self, data: bytes, content_type: str) -> str:
+        digest = blob_digest(data)
+        if await self._files.find_one({"_id": digest}, {"_id": 1}):
+            return digest
+        try:
+            await self._bucket.upload_from_stream_with_id(
+                digest, digest, data, metadata={"content_type": content_type}
+            )
+        except DuplicateKeyError:
+            # A concurrent upload of the same bytes won the race
+            pass
+        return digest
+
+    async def stat(self, digest: str) -> Optional[BlobInfo]:
+        record = await self._files.find_one({"_id": digest})
+        if record is None:
+            return None
+        content_type = (record.get("metadata") or {}).get("content_type", "application/octet-stream")
+        return BlobInfo(digest, record["length"], content_type)
+
+    async def stream(self, digest: str, start: int, end: int) -> AsyncIterator[bytes]:
+        grid_out = await self._bucket.open_download_stream(digest)
+        grid_out.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await grid_out.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def create_blob_store(kind: str, database=None, root=None):
+    if kind == "filesystem":
+        return FilesystemBlobStore(root)
+    if kind == "gridfs":
+        return GridFSBlobStore(database)
+    raise ValueError(f"Unknown blob store backend: {kind}")
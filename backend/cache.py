@@ -0,0 +1,244 @@
+"""
+Cache layer for read-heavy API paths
+Backends are pluggable: a bounded in-process LRU by default, or any
+Redis-compatible server (Redis, KeyDB, Dragonfly, ...) for multi-worker setups
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+import time
+
+import fast_json
+
+
+class LRUCache:
+    """Bounded LRU map with an optional per-entry TTL and hit/miss counters"""
+
+    def __init__(self, max_entries: int = 1000, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class MemoryCacheBackend:
+    """In-process backend; values are stored as-is, so callers must not mutate them"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 2000, ttl: Optional[float] = None):
+        self._cache = LRUCache(max_entries=max_entries, ttl=ttl)
+        # Counters never expire or get evicted, otherwise generations could repeat
+        self._counters = {}
+
+    async def get_many(self, keys: List[str]) -> List[Any]:
+        return [self._cache.get(key) for key in keys]
+
+    async def set_many(self, items: Dict[str, Any]):
+        for key, value in items.items():
+            self._cache.set(key, value)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._cache.delete(key)
+
+    async def incr(self, key: str) -> int:
+        self._counters[key] = self._counters.get(key, 0) + 1
+        return self._counters[key]
+
+    async def get_counters(self, keys: List[str]) -> List[int]:
+        return [self._counters.get(key, 0) for key in keys]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, **self._cache.stats()}
+
+
+class RedisCacheBackend:
+    """Redis-compatible backend; size is bounded by the server's maxmemory/LRU policy plus a TTL"""
+
+    name = "redis"
+
+    def __init__(self, url: str, ttl: Optional[float] = None, prefix: str = "studentmedia:"):
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            raise RuntimeError("The redis cache backend requires the 'redis' package (pip install redis)")
+
+        self._client = redis_asyncio.from_url(url)
+        self.ttl = int(ttl) if ttl else None
+        self.prefix = prefix
+
+    async def get_many(self, keys: List[str]) -> List[Any]:
+        if not keys:
+            return []
+        values = await self._client.mget([self.prefix + key for key in keys])
+        return [fast_json.loads(value) if value is not None else None for value in values]
+
+    async def set_many(self, items: Dict[str, Any]):
+        if not items:
+            return
+        pipe = self._client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(self.prefix + key, fast_json.dumps(value), ex=self.ttl)
+        await pipe.execute()
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self._client.delete(*[self.prefix + key for key in keys])
+
+    async def incr(self, key: str) -> int:
+        return await self._client.incr(self.prefix + key)
+
+    async def get_counters(self, keys: List[str]) -> List[int]:
+        values = await self._client.mget([self.prefix + key for key in keys])
+        return [int(value) if value is not None else 0 for value in values]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+def create_cache_backend(kind: str, max_entries: int, ttl: Optional[float], redis_url: Optional[str] = None):
+    if kind == "memory":
+        return MemoryCacheBackend(max_entries=max_entries, ttl=ttl)
+    if kind == "redis":
+        return RedisCacheBackend(redis_url or "redis://localhost:6379/0", ttl=ttl)
+    raise ValueError(f"Unknown cache backend: {kind}")
+
+
+class FeedCache:
+    """
+    Caches the user-independent parts of feed pages.
+
+    Pages are stored as ordered lists of post ids, and posts (body, author
+    snapshot, recent comments) are stored once per post, so a like or a comment
+    only touches one entry. Both key spaces carry a generation number: bumping
+    the page generation drops every page after a new post, bumping the global
+    generation drops everything (e.g. after an author rename).
+    """
+
+    PAGE_GENERATION = "feed:generation:pages"
+    GLOBAL_GENERATION = "feed:generation:all"
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.page_hits = 0
+        self.page_misses = 0
+        self.post_hits = 0
+        self.post_misses = 0
+
+    async def _page_key(self, page_key: str) -> str:
+        global_generation, page_generation = await self.backend.get_counters(
+            [self.GLOBAL_GENERATION, self.PAGE_GENERATION]
+        )
+        return f"feed:{global_generation}:page:{page_generation}:{page_key}"
+
+    async def _post_key_prefix(self) -> str:
+        [global_generation] = await self.backend.get_counters([self.GLOBAL_GENERATION])
+        return f"feed:{global_generation}:post:"
+
+    async def get_page(self, page_key: str):
+        """
+        Return (versioned_key, page); page is None on a miss, else {"post_ids", "next_cursor"}.
+        Store the rebuilt page under the returned key so a write that lands
+        while the page is being rebuilt leaves the stale copy unreachable.
+        """
+        versioned_key = await self._page_key(page_key)
+        [page] = await self.backend.get_many([versioned_key])
+        # Pages cached as bare id lists carry no cursor and are rebuilt
+        if not isinstance(page, dict):
+            page = None
+        if page is None:
+            self.page_misses += 1
+        else:
+            self.page_hits += 1
+        return versioned_key, page
+
+    async def set_page(self, versioned_key: str, post_ids: List[str], next_cursor: Optional[str] = None):
+        await self.backend.set_many({versioned_key: {"post_ids": list(post_ids), "next_cursor": next_cursor}})
+
+    async def get_posts(self, post_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        prefix = await self._post_key_prefix()
+        values = await self.backend.get_many([prefix + post_id for post_id in post_ids])
+        found = {post_id: value for post_id, value in zip(post_ids, values) if value is not None}
+        self.post_hits += len(found)
+        self.post_misses += len(post_ids) - len(found)
+        return found
+
+    async def set_posts(self, posts: Iterable[Dict[str, Any]]):
+        prefix = await self._post_key_prefix()
+        await self.backend.set_many({prefix + post["id"]: post for post in posts})
+
+    async def patch_post(self, post_id: str, field: str, delta: int):
+        """Apply a counter change to a cached post, if it is cached"""
+        key = await self._post_key_prefix() + post_id
+        [post] = await self.backend.get_many([key])
+        if post is not None:
+            await self.backend.set_many({key: {**post, field: post.get(field, 0) + delta}})
+
+    async def invalidate_post(self, post_id: str):
+        await self.backend.delete(await self._post_key_prefix() + post_id)
+
+    async def invalidate_pages(self):
+        await self.backend.incr(self.PAGE_GENERATION)
+
+    async def invalidate_all(self):
+        await self.backend.incr(self.GLOBAL_GENERATION)
+
+    def stats(self) -> Dict[str, Any]:
+        page_lookups = self.page_hits + self.page_misses
+        post_lookups = self.post_hits + self.post_misses
+        return {
+            "page_hits": self.page_hits,
+            "page_misses": self.page_misses,
+            "page_hit_rate": round(self.page_hits / page_lookups, 4) if page_lookups else 0.0,
+            "post_hits": self.post_hits,
+            "post_misses": self.post_misses,
+            "post_hit_rate": round(self.post_hits / post_lookups, 4) if post_lookups else 0.0,
+            **self.backend.stats(),
+        }
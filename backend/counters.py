@@ -0,0 +1,123 @@
+"""
+Write-behind buffer for hot document counters
+Every like or comment used to send its own $inc to the post document, so a
+popular post serialised thousands of writes on one document. Increments are
+now coalesced per document in process and flushed as one unordered bulk_write
+every flush interval, or sooner once max_pending_ops increments are waiting.
+Pending deltas can be overlaid on documents read from the database.
+"""
+from typing import Any, Dict, List
+import asyncio
+import logging
+import time
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+class CounterBuffer:
+    def __init__(self, collection, max_pending_ops: int = 500, read_overlay: bool = True, key_field: str = "id"):
+        self._collection = collection
+        self.max_pending_ops = max_pending_ops
+        self.read_overlay = read_overlay
+        self.key_field = key_field
+        self._pending: Dict[str, Dict[str, int]] = {}
+        # Increments queued per document, so requeued deltas restore their share of _pending_ops
+        self._pending_counts: Dict[str, int] = {}
+        self._pending_ops = 0
+        self._flush_lock = asyncio.Lock()
+        self._eager_flush = None
+        self.flushes = 0
+        self.flushed_ops = 0
+        self.flushed_documents = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+
+    def incr(self, key: str, field: str, delta: int = 1):
+        deltas = self._pending.setdefault(key, {})
+        deltas[field] = deltas.get(field, 0) + delta
+        self._pending_counts[key] = self._pending_counts.get(key, 0) + 1
+        self._pending_ops += 1
+
+        # Enough work queued: flush now instead of waiting for the next tick
+        if self._pending_ops >= self.max_pending_ops and (self._eager_flush is None or self._eager_flush.done()):
+            self._eager_flush = asyncio.get_running_loop().create_task(self.flush())
+
+    def pending(self, key: str) -> Dict[str, int]:
+        return dict(self._pending.get(key, {}))
+
+    def overlay(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Add not-yet-flushed deltas to documents just read from the database"""
+        if not self.read_overlay or not self._pending:
+            return documents
+        for document in documents:
+            for field, delta in self._pending.get(document.get(self.key_field), {}).items():
+                document[field] = document.get(field, 0) + delta
+        return documents
+
+    def _requeue(self, batch: Dict[str, Dict[str, int]], counts: Dict[str, int]):
+        for key, deltas in batch.items():
+            for field, delta in deltas.items():
+                pending = self._pending.setdefault(key, {})
+                pending[field] = pending.get(field, 0) + delta
+            self._pending_counts[key] = self._pending_counts.get(key, 0) + counts[key]
+            self._pending_ops += counts[key]
+
+    def _record_flush(self, ops: int, documents: int, started: float):
+        self.last_flush_ms = round((time.monotonic() - started) * 1000, 2)
+        self.flushes += 1
+        self.flushed_ops += ops
+        self.flushed_documents += documents
+
+    async def flush(self) -> int:
+        """Write every pending delta with one bulk_write; returns the number of documents updated"""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, counts, ops = self._pending, self._pending_counts, self._pending_ops
+            self._pending, self._pending_counts, self._pending_ops = {}, {}, 0
+
+            # Increments that cancelled out (like then unlike) never reach the database
+            keys = []
+            requests = []
+            for key, deltas in batch.items():
+                deltas = {field: delta for field, delta in deltas.items() if delta}
+                if deltas:
+                    keys.append(key)
+                    requests.append(UpdateOne({self.key_field: key}, {"$inc": deltas}))
+
+            started = time.monotonic()
+            try:
+                if requests:
+                    await self._collection.bulk_write(requests, ordered=False)
+            except BulkWriteError as exc:
+                # Unordered: everything except the reported writes was applied
+                failed = {keys[error["index"]] for error in exc.details.get("writeErrors", [])}
+                self._requeue({key: batch[key] for key in failed}, counts)
+                self.failed_flushes += 1
+                failed_ops = sum(counts[key] for key in failed)
+                self._record_flush(ops - failed_ops, len(requests) - len(failed), started)
+                logger.error("Counter flush: %d of %d updates failed, requeued", len(failed), len(requests))
+                return len(requests) - len(failed)
+            except PyMongoError:
+                # Nothing is known to be applied; retry the whole batch on the next flush
+                self._requeue(batch, counts)
+                self.failed_flushes += 1
+                logger.exception("Counter flush failed, %d updates requeued", len(requests))
+                return 0
+
+            self._record_flush(ops, len(requests), started)
+            return len(requests)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_documents": len(self._pending),
+            "pending_ops": self._pending_ops,
+            "flushes": self.flushes,
+            "flushed_ops": self.flushed_ops,
+            "flushed_documents": self.flushed_documents,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_ms": self.last_flush_ms,
+        }
@@ -0,0 +1,51 @@
+"""
+Single-pass JSON encoding for MongoDB documents
+ObjectId and datetime values are encoded directly while writing bytes, so
+responses no longer need a serialize -> dumps -> loads -> dumps round trip.
+Uses orjson when it is installed and falls back to the standard library.
+"""
+from datetime import datetime
+from typing import Any
+import json
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only without orjson
+    orjson = None
+
+
+def _default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        # orjson writes datetimes natively in the same isoformat() layout
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content,
+        default=_default,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class MongoJSONResponse(JSONResponse):
+    """JSONResponse that accepts raw MongoDB documents and encodes them in one pass"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
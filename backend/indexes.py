@@ -0,0 +1,132 @@
+"""
+Declared MongoDB indexes for every query shape in server.py
+ensure_indexes() creates them on startup and index_drift() compares the
+declared set with what the database actually has.
+"""
+from typing import Any, Dict, List
+import logging
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+class IndexSpec:
+    def __init__(self, collection: str, keys: List[tuple], unique: bool = False, name: str = None, **options):
+        self.collection = collection
+        self.keys = keys
+        self.unique = unique
+        self.name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        self.options = options
+
+    def matches(self, existing: Dict[str, Any]) -> bool:
+        if list(existing["key"].items()) != [(field, direction) for field, direction in self.keys]:
+            return False
+        if bool(existing.get("unique", False)) != self.unique:
+            return False
+        return all(existing.get(option) == value for option, value in self.options.items())
+
+    def describe(self) -> Dict[str, Any]:
+        return {"keys": dict(self.keys), "unique": self.unique, **self.options}
+
+
+INDEX_SPECS = [
+    # Auth: register/login/get_current_user lookups
+    IndexSpec("users", [("id", ASCENDING)], unique=True),
+    IndexSpec("users", [("email", ASCENDING)], unique=True),
+    IndexSpec("users", [("roll_number", ASCENDING)], unique=True),
+    IndexSpec("user_passwords", [("user_id", ASCENDING)], unique=True),
+    IndexSpec("verification_codes", [("email", ASCENDING), ("code", ASCENDING), ("expires_at", ASCENDING)]),
+
+    # Expiry: TTL indexes delete codes once expires_at has passed
+    IndexSpec("verification_codes", [("expires_at", ASCENDING)], expireAfterSeconds=0),
+    IndexSpec("demo_codes", [("expires_at", ASCENDING)], expireAfterSeconds=0),
+    IndexSpec("demo_codes", [("email", ASCENDING), ("_id", DESCENDING)]),
+
+    # Sessions: refresh token lookup and expiry, revoked access-token ids and users
+    IndexSpec("refresh_tokens", [("token_hash", ASCENDING)], unique=True),
+    IndexSpec("refresh_tokens", [("user_id", ASCENDING)]),
+    IndexSpec("refresh_tokens", [("expires_at", ASCENDING)], expireAfterSeconds=0),
+    IndexSpec("revoked_tokens", [("jti", ASCENDING)], unique=True),
+    IndexSpec("revoked_tokens", [("expires_at", ASCENDING)], expireAfterSeconds=0),
+    IndexSpec("revoked_users", [("user_id", ASCENDING)], unique=True),
+    IndexSpec("revoked_users", [("expires_at", ASCENDING)], expireAfterSeconds=0),
+
+    # Feed: keyset order, department feed/search filter, author snapshot propagation
+    IndexSpec("posts", [("id", ASCENDING)], unique=True),
+    IndexSpec("posts", [("created_at", DESCENDING), ("id", DESCENDING)]),
+    IndexSpec("posts", [("user.department", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    IndexSpec("posts", [("user_id", ASCENDING)]),
+
+    # Engagement: one like/bookmark per user and post, batched flag lookups
+    IndexSpec("post_likes", [("post_id", ASCENDING), ("user_id", ASCENDING)], unique=True),
+    IndexSpec("post_bookmarks", [("post_id", ASCENDING), ("user_id", ASCENDING)], unique=True),
+
+    # Bookmarks: a user's bookmarks in keyset order
+    IndexSpec("post_bookmarks", [("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+
+    # Search: postings per term newest first (optionally per department), term statistics keyed by _id
+    IndexSpec("search_postings", [("term", ASCENDING), ("post_id", ASCENDING)], unique=True),
+    IndexSpec("search_postings", [("term", ASCENDING), ("created_at", DESCENDING), ("post_id", DESCENDING)]),
+    IndexSpec("search_postings", [("term", ASCENDING), ("department", ASCENDING), ("created_at", DESCENDING), ("post_id", DESCENDING)]),
+
+    # Comments: recent comments and keyset pages per post, author snapshot propagation
+    IndexSpec("comments", [("id", ASCENDING)], unique=True),
+    IndexSpec("comments", [("post_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    IndexSpec("comments", [("user_id", ASCENDING)]),
+]
+
+
+async def ensure_indexes(db, specs: List[IndexSpec] = None) -> Dict[str, List[str]]:
+    """Create every declared index; failures (e.g. duplicates blocking a unique index) are logged, not raised"""
+    report = {"ensured": [], "failed": []}
+    for spec in specs or INDEX_SPECS:
+        label = f"{spec.collection}.{spec.name}"
+        try:
+            await db[spec.collection].create_index(spec.keys, name=spec.name, unique=spec.unique, **spec.options)
+            report["ensured"].append(label)
+        except OperationFailure as exc:
+            logger.error("Could not create index %s: %s", label, exc)
+            report["failed"].append(label)
+    return report
+
+
+async def index_drift(db, specs: List[IndexSpec] = None) -> Dict[str, Any]:
+    """Compare declared indexes with the database: missing, changed and undeclared ones"""
+    specs = specs or INDEX_SPECS
+    drift = {"missing": [], "changed": [], "undeclared": []}
+
+    declared_by_collection = {}
+    for spec in specs:
+        declared_by_collection.setdefault(spec.collection, {})[spec.name] = spec
+
+    for collection, declared in declared_by_collection.items():
+        existing = {index["name"]: index async for index in db[collection].list_indexes()}
+        for name, spec in declared.items():
+            label = f"{collection}.{name}"
+            if name not in existing:
+                drift["missing"].append(label)
+            elif not spec.matches(existing[name]):
+                drift["changed"].append({
+                    "index": label,
+                    "declared": spec.describe(),
+                    "actual": {"keys": dict(existing[name]["key"]), "unique": bool(existing[name].get("unique", False))},
+                })
+        for name in existing:
+            if name != "_id_" and name not in declared:
+                drift["undeclared"].append(f"{collection}.{name}")
+
+    return drift
+
+
+def log_index_drift(drift: Dict[str, Any]):
+    if not any(drift.values()):
+        logger.info("Indexes match the declared set")
+        return
+    for label in drift["missing"]:
+        logger.warning("Index drift: %s is declared but missing", label)
+    for change in drift["changed"]:
+        logger.warning("Index drift: %s differs (declared %s, actual %s)", change["index"], change["declared"], change["actual"])
+    for label in drift["undeclared"]:
+        logger.warning("Index drift: %s exists but is not declared in indexes.py", label)
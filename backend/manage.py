@@ -0,0 +1,93 @@
+"""
+Maintenance commands for the StudentMedia backend
+Run from the backend directory, e.g. `python manage.py --help`
+"""
+import asyncio
+
+import typer
+
+import server
+from indexes import ensure_indexes, index_drift
+
+cli = typer.Typer(help="StudentMedia maintenance commands")
+
+
+@cli.command()
+def backfill_author_snapshots(batch_size: int = 500):
+    """Embed author snapshots into posts and comments created before snapshots existed"""
+    updated = asyncio.run(server.backfill_author_snapshots(batch_size))
+    for collection, count in updated.items():
+        typer.echo(f"{collection}: {count} documents updated")
+
+
+@cli.command()
+def migrate_inline_images(batch_size: int = 100):
+    """Move base64 images embedded in posts and user profiles into the blob store"""
+    migrated = asyncio.run(server.migrate_inline_images(batch_size))
+    for collection, count in migrated.items():
+        typer.echo(f"{collection}: {count} images moved")
+
+
+@cli.command()
+def migrate_credentials(batch_size: int = 500):
+    """Copy password hashes from user_passwords onto user documents for single-lookup login"""
+    migrated = asyncio.run(server.migrate_credentials(batch_size))
+    typer.echo(f"users: {migrated} credentials moved")
+
+
+@cli.command()
+def purge_legacy_codes():
+    """Delete verification and demo codes written before they had an expiry"""
+    purged = asyncio.run(server.purge_unexpiring_codes())
+    for collection, count in purged.items():
+        typer.echo(f"{collection}: {count} codes deleted")
+
+
+@cli.command()
+def rebuild_comment_rings(batch_size: int = 500):
+    """Regenerate the recent_comments preview ring on every post from the comments collection"""
+    rebuilt = asyncio.run(server.rebuild_comment_rings(batch_size))
+    typer.echo(f"posts: {rebuilt} rings rebuilt")
+
+
+@cli.command()
+def rebuild_search_index(batch_size: int = 500):
+    """Re-create the search inverted index from every post"""
+    indexed = asyncio.run(server.rebuild_search_index(batch_size))
+    typer.echo(f"posts: {indexed} indexed")
+
+
+@cli.command()
+def reconcile_counters(batch_size: int = 500, settle_seconds: float = 1.0):
+    """Recompute likes_count/comments_count from likes and comments and repair drifted posts"""
+    report = asyncio.run(server.reconcile_post_counters(batch_size, settle_seconds))
+    typer.echo(f"{report['scanned']} posts scanned, {report['drifted']} drifted, {report['repaired']} repaired")
+    typer.echo(f"likes_count off by {report['likes_count_drift']}, comments_count off by {report['comments_count_drift']}")
+
+
+@cli.command()
+def sync_indexes():
+    """Create every index declared in indexes.py"""
+    report = asyncio.run(ensure_indexes(server.db))
+    typer.echo(f"{len(report['ensured'])} indexes ensured")
+    for label in report["failed"]:
+        typer.echo(f"FAILED: {label}", err=True)
+
+
+@cli.command()
+def check_indexes():
+    """Report drift between declared and actual indexes; exits 1 when they differ"""
+    drift = asyncio.run(index_drift(server.db))
+    for label in drift["missing"]:
+        typer.echo(f"missing:    {label}")
+    for change in drift["changed"]:
+        typer.echo(f"changed:    {change['index']} declared={change['declared']} actual={change['actual']}")
+    for label in drift["undeclared"]:
+        typer.echo(f"undeclared: {label}")
+    if any(drift.values()):
+        raise typer.Exit(code=1)
+    typer.echo("Indexes match the declared set")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,62 @@
+"""
+Password hashing off the event loop
+bcrypt spends ~200ms of CPU per call; running it inline in an async handler
+stalls every other request. Calls run on a bounded thread pool instead (the
+bcrypt C extension releases the GIL, so throughput scales with cores) and a
+semaphore caps how many run at once, with the backlog exposed as a metric.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+import asyncio
+import time
+
+
+class PasswordHasher:
+    def __init__(self, context, max_workers: int):
+        self._context = context
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+        self._slots = asyncio.Semaphore(max_workers)
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.running = 0
+        self.completed = 0
+        self.total_wait_seconds = 0.0
+
+    async def _run(self, fn, *args):
+        enqueued_at = time.monotonic()
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queue_depth -= 1
+
+        self.total_wait_seconds += time.monotonic() - enqueued_at
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self._context.hash, password)
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        return await self._run(self._context.verify, password, password_hash)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "running": self.running,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "completed": self.completed,
+            "avg_wait_ms": round(self.total_wait_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+        }
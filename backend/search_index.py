@@ -0,0 +1,333 @@
+"""
+Inverted index for post search
+Posts are tokenised once when they are written. search_postings holds one
+document per (term, post), read newest first through the (term, created_at,
+post_id) index, and search_terms keeps every term's document frequency.
+A query walks the postings of its rarest term in index order and checks the
+other terms for a batch of candidates at a time, so the work per page
+depends on the page size rather than on how many posts exist. Query text is
+tokenised the same way and never reaches the database as a regex.
+
+rank() orders matches by BM25 over content and tags, damped by post age.
+Term frequencies and lengths are stored on the postings and collection
+statistics (post count, total length) in search_stats, all maintained as
+posts are indexed, so scoring needs no pass over the posts themselves.
+The same statistics give estimated_total for every query without counting.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import heapq
+import math
+import re
+import unicodedata
+
+from pymongo import UpdateOne
+
+TOKEN_PATTERN = re.compile(r"\w+")
+MAX_TERM_LENGTH = 40
+
+# A trailing word that is still being typed also matches the most common terms it prefixes
+MIN_PREFIX_LENGTH = 3
+PREFIX_EXPANSION = 20
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def normalize(text: str) -> str:
+    """Case-fold and strip accents so "Café" and "cafe" index to the same term"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(normalize(text)) if len(token) <= MAX_TERM_LENGTH]
+
+
+def document_terms(content: str, tags: List[str]) -> Dict[str, int]:
+    """Term frequencies over a post's content and tags"""
+    counts = {}
+    for token in tokenize(content) + [token for tag in tags for token in tokenize(tag)]:
+        counts[token] = counts.get(token, 0) + 1
+    return counts
+
+
+class SearchIndex:
+    def __init__(
+        self,
+        database,
+        batch_size: int = 200,
+        max_scan: int = 5000,
+        max_candidates: int = 5000,
+        half_life_days: float = 14.0
+    ):
+        self._postings = database.search_postings
+        self._terms = database.search_terms
+        self._stats = database.search_stats
+        self.batch_size = batch_size
+        self.max_scan = max_scan
+        self.max_candidates = max_candidates
+        self.half_life_days = half_life_days
+
+    async def index_post(self, post: Dict[str, Any]):
+        """Add a post's postings; re-indexing the same post is a no-op"""
+        frequencies = document_terms(post["content"], post.get("tags") or [])
+        terms = list(frequencies)
+        if not terms:
+            return
+        length = sum(frequencies.values())
+        author = post.get("user") or {}
+        result = await self._postings.bulk_write([
+            UpdateOne(
+                {"term": term, "post_id": post["id"]},
+                {"$setOnInsert": {
+                    "created_at": post["created_at"],
+                    "department": author.get("department"),
+                    "year": author.get("year"),
+                    "tf": frequencies[term],
+                    "length": length
+                }},
+                upsert=True
+            )
+            for term in terms
+        ], ordered=False)
+
+        # Only postings that were actually inserted count towards document frequencies
+        new_terms = [terms[index] for index in result.upserted_ids]
+        if new_terms:
+            await self._terms.bulk_write([
+                UpdateOne({"_id": term}, {"$inc": {"df": 1}}, upsert=True)
+                for term in new_terms
+            ], ordered=False)
+
+        # A post is new to the index when none of its postings existed
+        if len(new_terms) == len(terms):
+            counts = {"documents": 1, "total_length": length}
+            if author.get("department"):
+                counts[f"departments.{author['department']}"] = 1
+            if author.get("year"):
+                counts[f"years.{author['year']}"] = 1
+            await self._stats.update_one({"_id": "posts"}, {"$inc": counts}, upsert=True)
+
+    async def clear(self):
+        await self._postings.delete_many({})
+        await self._terms.delete_many({})
+        await self._stats.delete_many({})
+
+    async def is_empty(self) -> bool:
+        return await self._terms.find_one({}, {"_id": 1}) is None
+
+    async def statistics(self) -> Dict[str, Any]:
+        return await self._stats.find_one({"_id": "posts"}) or {}
+
+    def estimate_total(
+        self,
+        stats: Dict[str, Any],
+        groups: List[List[str]] = (),
+        frequencies: Dict[str, int] = None,
+        department: Optional[str] = None,
+        year: Optional[int] = None
+    ) -> int:
+        """Estimated number of matches from document frequencies, assuming terms and filters are independent"""
+        documents = stats.get("documents", 0)
+        if not documents:
+            return 0
+        estimate = float(documents)
+        for group in groups:
+            group_documents = min(sum(frequencies.get(term, 0) for term in group), documents)
+            estimate *= group_documents / documents
+        if department:
+            estimate *= stats.get("departments", {}).get(department, 0) / documents
+        if year:
+            estimate *= stats.get("years", {}).get(str(year), 0) / documents
+        return int(round(estimate))
+
+    async def parse_query(self, query: str) -> Tuple[List[List[str]], Dict[str, int]]:
+        """Split a query into AND-ed groups of OR-ed terms, with each term's document frequency"""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return [], {}
+        groups = [[token] for token in tokens]
+
+        prefix = tokens[-1]
+        if len(prefix) >= MIN_PREFIX_LENGTH and not query[-1:].isspace():
+            expansions = await self._terms.find(
+                {"_id": {"$gt": prefix, "$lt": prefix + "\uffff"}}, {"_id": 1}
+            ).sort("df", -1).limit(PREFIX_EXPANSION).to_list(length=PREFIX_EXPANSION)
+            groups[-1].extend(term["_id"] for term in expansions)
+
+        all_terms = [term for group in groups for term in group]
+        frequencies = {
+            term["_id"]: term["df"]
+            async for term in self._terms.find({"_id": {"$in": all_terms}})
+        }
+        return groups, frequencies
+
+    async def _matching(self, candidates: List[Dict[str, Any]], groups: List[List[str]]) -> List[Dict[str, Any]]:
+        """Keep candidates that have a posting in every group"""
+        if not groups:
+            return candidates
+        post_ids = [candidate["post_id"] for candidate in candidates]
+        hits = {}
+        async for posting in self._postings.find(
+            {"term": {"$in": [term for group in groups for term in group]}, "post_id": {"$in": post_ids}},
+            {"_id": 0, "term": 1, "post_id": 1}
+        ):
+            hits.setdefault(posting["post_id"], set()).add(posting["term"])
+        return [
+            candidate for candidate in candidates
+            if all(hits.get(candidate["post_id"], set()).intersection(group) for group in groups)
+        ]
+
+    async def search(
+        self,
+        query: str,
+        department: Optional[str] = None,
+        year: Optional[int] = None,
+        limit: int = 50,
+        before: Optional[Tuple[datetime, str]] = None
+    ) -> Tuple[List[Dict[str, Any]], int, Optional[Tuple[datetime, str]]]:
+        """Newest matching postings ({"post_id", "created_at"}) older than before, and the estimated total
+
+        When the scan budget runs out before the page fills, the (created_at, post_id)
+        of the last posting scanned comes back as well, so the next page resumes there.
+        """
+        groups, frequencies = await self.parse_query(query)
+        group_sizes = [sum(frequencies.get(term, 0) for term in group) for group in groups]
+        if not groups or not all(group_sizes):
+            return [], 0, None
+        estimated_total = self.estimate_total(await self.statistics(), groups, frequencies, department, year)
+
+        # Drive the scan with the rarest group; the others are checked per batch
+        order = sorted(range(len(groups)), key=group_sizes.__getitem__)
+        driver, others = groups[order[0]], [groups[index] for index in order[1:]]
+
+        posting_filter = {"term": {"$in": driver}}
+        if department:
+            posting_filter["department"] = department
+        if year:
+            posting_filter["year"] = year
+        if before:
+            created_at, post_id = before
+            posting_filter["$or"] = [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "post_id": {"$lt": post_id}}
+            ]
+        postings = self._postings.find(posting_filter, {"_id": 0, "post_id": 1, "created_at": 1}) \
+            .sort([("created_at", -1), ("post_id", -1)]) \
+            .batch_size(self.batch_size)
+
+        results = []
+        seen = set()
+        batch = []
+        resume_after = None
+        async for posting in postings:
+            # A post matching several prefix expansions appears once per term
+            if posting["post_id"] in seen:
+                continue
+            seen.add(posting["post_id"])
+            batch.append(posting)
+            if len(batch) < self.batch_size:
+                continue
+            results.extend(await self._matching(batch, others))
+            batch = []
+            if len(results) >= limit:
+                break
+            if len(seen) >= self.max_scan:
+                resume_after = (posting["created_at"], posting["post_id"])
+                break
+        if batch:
+            results.extend(await self._matching(batch, others))
+
+        return results[:limit], estimated_total, resume_after
+
+    async def rank(
+        self,
+        query: str,
+        department: Optional[str] = None,
+        year: Optional[int] = None,
+        limit: int = 50,
+        after: Optional[Tuple[float, str]] = None,
+        now: Optional[datetime] = None
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """Best matches by BM25 with recency decay ({"post_id", "created_at", "score"}), and the estimated total
+
+        Pages continue strictly after the (score, post_id) position in after; passing the
+        first page's now keeps the recency decay, and therefore the scores, identical.
+        """
+        groups, frequencies = await self.parse_query(query)
+        group_sizes = [sum(frequencies.get(term, 0) for term in group) for group in groups]
+        if not groups or not all(group_sizes):
+            return [], 0
+
+        stats = await self.statistics()
+        estimated_total = self.estimate_total(stats, groups, frequencies, department, year)
+        documents = max(stats.get("documents", 0), 1)
+        average_length = stats.get("total_length", 0) / documents or 1.0
+
+        # Candidates are the newest postings of the rarest group, bounded so cost stays flat;
+        # walking all terms together would let a common term crowd the rarer ones out
+        order = sorted(range(len(groups)), key=group_sizes.__getitem__)
+        driver = groups[order[0]]
+        other_terms = [term for index in order[1:] for term in groups[index]]
+
+        posting_filter = {"term": {"$in": driver}}
+        if department:
+            posting_filter["department"] = department
+        if year:
+            posting_filter["year"] = year
+        postings = await self._postings.find(
+            posting_filter, {"_id": 0, "term": 1, "post_id": 1, "created_at": 1, "tf": 1, "length": 1}
+        ).sort([("created_at", -1), ("post_id", -1)]).limit(self.max_candidates).to_list(length=self.max_candidates)
+
+        candidates = {}
+        for posting in postings:
+            candidate = candidates.setdefault(posting["post_id"], {
+                "post_id": posting["post_id"],
+                "created_at": posting["created_at"],
+                "length": posting.get("length") or average_length,
+                "tf": {}
+            })
+            # Postings indexed before term frequencies were stored count once
+            candidate["tf"][posting["term"]] = posting.get("tf", 1)
+
+        # Frequencies of the other terms, for these candidates only, through the (term, post_id) index
+        if other_terms and candidates:
+            async for posting in self._postings.find(
+                {"term": {"$in": other_terms}, "post_id": {"$in": list(candidates)}},
+                {"_id": 0, "term": 1, "post_id": 1, "tf": 1}
+            ):
+                candidates[posting["post_id"]]["tf"][posting["term"]] = posting.get("tf", 1)
+
+        idf = {
+            term: math.log(1 + (documents - df + 0.5) / (df + 0.5))
+            for term, df in frequencies.items()
+        }
+        now = now or datetime.utcnow()
+
+        def score(candidate):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * candidate["length"] / average_length)
+            relevance = sum(
+                idf.get(term, 0.0) * tf * (BM25_K1 + 1) / (tf + norm)
+                for term, tf in candidate["tf"].items()
+            )
+            if self.half_life_days:
+                age_days = max((now - candidate["created_at"]).total_seconds(), 0) / 86400
+                relevance *= 0.5 ** (age_days / self.half_life_days)
+            # Rounded so the value round-trips through a cursor unchanged
+            return round(relevance, 6)
+
+        scored = (
+            ((score(candidate), candidate["post_id"]), candidate)
+            for candidate in candidates.values()
+            if all(candidate["tf"].keys() & set(group) for group in groups)
+        )
+        if after:
+            scored = (item for item in scored if item[0] < tuple(after))
+        top = heapq.nlargest(limit, scored, key=lambda item: item[0])
+        hits = [
+            {"post_id": candidate["post_id"], "created_at": candidate["created_at"], "score": key[0]}
+            for key, candidate in top
+        ]
+        return hits, estimated_total
@@ -1,9 +1,11 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, BackgroundTasks
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, BackgroundTasks, Header, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from pydantic import BaseModel, Field, EmailStr, validator
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
@@ -14,13 +16,24 @@ import hashlib
 import secrets
 import smtplib
 import re
+import base64
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from pathlib import Path
 import jwt
 from passlib.context import CryptContext
 import json
-from bson import ObjectId
+import asyncio
+import time
+
+from blob_store import create_blob_store, is_valid_digest
+from bloom import BloomFilter
+from cache import FeedCache, LRUCache, create_cache_backend
+from counters import CounterBuffer
+from fast_json import MongoJSONResponse
+from indexes import ensure_indexes, index_drift, log_index_drift
+from password_hashing import PasswordHasher
+from search_index import SearchIndex
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -33,32 +46,105 @@ db = client[os.environ['DB_NAME']]
 # Security
 security = HTTPBearer()
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt runs on a bounded worker pool so logins never block the event loop
+password_hasher = PasswordHasher(
+    pwd_context,
+    max_workers=int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 4))
+)
 SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
 
-app = FastAPI(title="StudentMedia API", version="1.0.0")
-api_router = APIRouter(prefix="/api")
-
-# Custom JSON encoder for ObjectId and datetime
-class JSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, ObjectId):
-            return str(obj)
-        elif isinstance(obj, datetime):
-            return obj.isoformat()
-        return super().default(obj)
-
-# Utility function to convert ObjectIds and datetimes to JSON-serializable formats
-def serialize_object_ids(obj):
-    """Recursively convert ObjectId instances to strings and datetime to ISO format in MongoDB results"""
-    if isinstance(obj, ObjectId):
-        return str(obj)
-    elif isinstance(obj, datetime):
-        return obj.isoformat()
-    elif isinstance(obj, dict):
-        return {k: serialize_object_ids(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [serialize_object_ids(item) for item in obj]
-    return obj
+# "lookup" loads the user from Mongo on every request; "claims" embeds the profile
+# fields routes read into short-lived tokens so read paths skip the lookup
+AUTH_TOKEN_MODE = os.environ.get('AUTH_TOKEN_MODE', 'lookup')
+# The web client stores the access token once and never calls /auth/refresh, so tokens
+# stay day-long by default; set ACCESS_TOKEN_EXPIRE_MINUTES=15 once clients refresh
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get('ACCESS_TOKEN_EXPIRE_MINUTES', 24 * 60))
+CLAIMS_TOKEN_EXPIRE_MINUTES = int(os.environ.get('CLAIMS_TOKEN_EXPIRE_MINUTES', 15))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get('REFRESH_TOKEN_EXPIRE_DAYS', 30))
+
+# Revoked access-token ids live in Mongo and are mirrored into an in-memory Bloom
+# filter, rebuilt periodically, so the per-request check costs no round trip
+REVOCATION_FILTER_CAPACITY = int(os.environ.get('REVOCATION_FILTER_CAPACITY', 100000))
+REVOCATION_REFRESH_SECONDS = float(os.environ.get('REVOCATION_REFRESH_SECONDS', 30))
+
+# Users whose earlier tokens are no longer accepted, mirrored from the revoked_users
+# collection on the same schedule; entries only need to outlive a claims token
+revoked_users = LRUCache(max_entries=100000, ttl=CLAIMS_TOKEN_EXPIRE_MINUTES * 60)
+
+# Authenticated users are cached per process; writes to a profile invalidate its entry
+user_cache = LRUCache(
+    max_entries=int(os.environ.get('USER_CACHE_MAX_ENTRIES', 10000)),
+    ttl=float(os.environ.get('USER_CACHE_TTL_SECONDS', 60))
+)
+
+# Other workers can embed an author's old name or avatar until their cached user or claims
+# token is dropped, so a profile change is propagated once more after that window
+SNAPSHOT_REPAIR_DELAY_SECONDS = float(os.environ.get(
+    'SNAPSHOT_REPAIR_DELAY_SECONDS', max(user_cache.ttl, REVOCATION_REFRESH_SECONDS) + 5
+))
+
+# Demo mode keeps verification codes readable through /api/demo endpoints (disable in production)
+DEMO_MODE = os.environ.get('DEMO_MODE', 'true').lower() == 'true'
+VERIFICATION_CODE_TTL = timedelta(minutes=15)
+
+# /api/metrics requires this value in the X-Metrics-Token header; unset disables the endpoint
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Indexes declared in indexes.py are created on startup unless disabled
+AUTO_CREATE_INDEXES = os.environ.get('AUTO_CREATE_INDEXES', 'true').lower() == 'true'
+
+# Feed
+# "query" sorts the posts collection on every read, "timeline" reads precomputed fan-out timelines
+FEED_MODE = os.environ.get('FEED_MODE', 'query')
+TIMELINE_LENGTH = int(os.environ.get('TIMELINE_LENGTH', 500))
+
+# Media: images are stored once per SHA-256 and documents keep only a short URL
+blob_store = create_blob_store(
+    os.environ.get('MEDIA_BACKEND', 'filesystem'),
+    database=db,
+    root=os.environ.get('MEDIA_ROOT', str(ROOT_DIR / 'media'))
+)
+MEDIA_BASE_URL = os.environ.get('MEDIA_BASE_URL', '/api/media').rstrip('/')
+MAX_IMAGE_BYTES = int(os.environ.get('MAX_IMAGE_BYTES', 5 * 1024 * 1024))
+
+# Comment previews on feed posts: "query" aggregates the comments collection per page,
+# "embedded" reads the capped recent_comments ring that add_comment keeps on each post
+COMMENT_PREVIEW_MODE = os.environ.get('COMMENT_PREVIEW_MODE', 'query')
+RECENT_COMMENTS_LENGTH = int(os.environ.get('RECENT_COMMENTS_LENGTH', 3))
+
+# Feed page cache ("memory" or "redis" for any Redis-compatible server)
+feed_cache = FeedCache(create_cache_backend(
+    os.environ.get('FEED_CACHE_BACKEND', 'memory'),
+    max_entries=int(os.environ.get('FEED_CACHE_MAX_ENTRIES', 2000)),
+    ttl=float(os.environ.get('FEED_CACHE_TTL_SECONDS', 60)),
+    redis_url=os.environ.get('FEED_CACHE_REDIS_URL')
+))
+
+# likes_count/comments_count increments are coalesced per post and flushed with one
+# bulk_write every interval or max ops; an interval of 0 writes each increment through
+COUNTER_FLUSH_INTERVAL_MS = int(os.environ.get('COUNTER_FLUSH_INTERVAL_MS', 200))
+post_counters = CounterBuffer(
+    db.posts,
+    max_pending_ops=int(os.environ.get('COUNTER_FLUSH_MAX_OPS', 500)),
+    read_overlay=os.environ.get('COUNTER_READ_OVERLAY', 'true').lower() == 'true'
+)
+
+# Counters are periodically recomputed from post_likes/comments and repaired (0 disables);
+# drift must persist across the settle delay so buffered increments are not mistaken for it
+RECONCILE_INTERVAL_SECONDS = float(os.environ.get('RECONCILE_INTERVAL_SECONDS', 3600))
+RECONCILE_SETTLE_SECONDS = float(os.environ.get('RECONCILE_SETTLE_SECONDS', max(1.0, 2 * COUNTER_FLUSH_INTERVAL_MS / 1000)))
+
+# Search reads a maintained inverted index (search_index.py) instead of scanning posts
+search_index = SearchIndex(
+    db,
+    max_scan=int(os.environ.get('SEARCH_MAX_SCAN', 5000)),
+    max_candidates=int(os.environ.get('SEARCH_MAX_CANDIDATES', 5000)),
+    half_life_days=float(os.environ.get('SEARCH_RECENCY_HALF_LIFE_DAYS', 14))
+)
+
+# Documents are encoded straight to bytes, ObjectId and datetime included
+app = FastAPI(title="StudentMedia API", version="1.0.0", default_response_class=MongoJSONResponse)
+api_router = APIRouter(prefix="/api", default_response_class=MongoJSONResponse)
 
 # Models
 class UserRegistration(BaseModel):
@@ -90,6 +176,12 @@ class EmailVerification(BaseModel):
     email: EmailStr
     verification_code: str
 
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
 class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
@@ -102,20 +194,34 @@ class User(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     bio: Optional[str] = None
 
+class TokenUser(BaseModel):
+    """Identity rebuilt from a claims token; only the fields routes read"""
+    id: str
+    name: str
+    department: str
+    year: int
+    is_verified: bool = False
+    profile_image: Optional[str] = None
+
 class PostCreate(BaseModel):
     content: str = Field(..., min_length=1, max_length=2000)
     image: Optional[str] = None  # Base64 encoded image
     tags: List[str] = Field(default_factory=list)
 
+class CommentCreate(BaseModel):
+    content: str = Field(..., min_length=1, max_length=2000)
+
 class Post(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
+    user: Optional[Dict[str, Any]] = None  # Author snapshot, see author_snapshot()
     content: str
     image: Optional[str] = None
     tags: List[str] = Field(default_factory=list)
     likes_count: int = 0
     comments_count: int = 0
     shares_count: int = 0
+    recent_comments: List[Dict[str, Any]] = Field(default_factory=list)  # Preview ring, see comment_ring_entry()
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -123,6 +229,7 @@ class Comment(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     post_id: str
     user_id: str
+    user: Optional[Dict[str, Any]] = None  # Author snapshot, see author_snapshot()
     content: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -150,40 +257,507 @@ class SearchQuery(BaseModel):
     query: str
     department: Optional[str] = None
     year: Optional[int] = None
+    sort: str = "recent"  # "recent" or "relevance" (BM25 with recency decay)
+    cursor: Optional[str] = None  # next_cursor / X-Next-Cursor of the previous page
+    limit: int = Field(50, ge=1, le=100)
+    
+    @validator('sort')
+    def validate_sort(cls, v):
+        if v not in ("recent", "relevance"):
+            raise ValueError('Sort must be "recent" or "relevance"')
+        return v
+
+# action -> (engagement collection, target state)
+ENGAGEMENT_ACTIONS = {
+    "like": ("post_likes", True),
+    "unlike": ("post_likes", False),
+    "bookmark": ("post_bookmarks", True),
+    "unbookmark": ("post_bookmarks", False)
+}
+
+class EngagementOperation(BaseModel):
+    post_id: str
+    action: str
+    
+    @validator('action')
+    def validate_action(cls, v):
+        if v not in ENGAGEMENT_ACTIONS:
+            raise ValueError(f'Action must be one of: {", ".join(ENGAGEMENT_ACTIONS)}')
+        return v
+
+class EngagementBatch(BaseModel):
+    operations: List[EngagementOperation] = Field(..., min_length=1, max_length=500)
+
+# Author fields embedded into posts and comments at write time, so reads need no users $lookup
+AUTHOR_SNAPSHOT_FIELDS = ["id", "name", "department", "year", "profile_image"]
+
+# Fields returned for a post in feed and search responses
+POST_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "user_id": 1,
+    "content": 1,
+    "image": 1,
+    "tags": 1,
+    "likes_count": 1,
+    "comments_count": 1,
+    "shares_count": 1,
+    "created_at": 1,
+    "updated_at": 1,
+    "user.id": 1,
+    "user.name": 1,
+    "user.department": 1,
+    "user.year": 1,
+    "user.profile_image": 1,
+    "recent_comments": 1
+}
+
+# Search results carry no comment previews
+SEARCH_RESULT_PROJECTION = {field: value for field, value in POST_PROJECTION.items() if field != "recent_comments"}
+
+# Author fields shown next to a comment
+COMMENT_USER_FIELDS = ["name", "department", "year"]
 
 # Utility Functions
-def create_access_token(data: dict):
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(hours=24)
-    to_encode.update({"exp": expire})
+    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    # Float iat so a revocation and a re-issue within the same second stay ordered
+    to_encode.update({"exp": expire, "iat": time.time(), "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm="HS256")
     return encoded_jwt
 
+def issue_access_token(user: User):
+    if AUTH_TOKEN_MODE != "claims":
+        return create_access_token(data={"sub": user.id})
+    return create_access_token(
+        data={
+            "sub": user.id,
+            "name": user.name,
+            "department": user.department,
+            "year": user.year,
+            "verified": user.is_verified,
+            "profile_image": user.profile_image
+        },
+        expires_delta=timedelta(minutes=CLAIMS_TOKEN_EXPIRE_MINUTES)
+    )
+
+async def revoke_user_tokens(user_id: str):
+    """Reject tokens issued to a user before now, e.g. after a ban or a profile change"""
+    revoked_at = time.time()
+    await db.revoked_users.update_one(
+        {"user_id": user_id},
+        {
+            "$max": {"revoked_at": revoked_at},
+            "$set": {"expires_at": datetime.utcnow() + timedelta(minutes=CLAIMS_TOKEN_EXPIRE_MINUTES)}
+        },
+        upsert=True
+    )
+    revoked_users.set(user_id, revoked_at)
+
+async def load_revoked_users():
+    """Mirror per-user revocations made by any worker into this process"""
+    active = {"expires_at": {"$gt": datetime.utcnow()}}
+    async for record in db.revoked_users.find(active, {"_id": 0, "user_id": 1, "revoked_at": 1}):
+        if record["revoked_at"] > (revoked_users.get(record["user_id"]) or 0):
+            revoked_users.set(record["user_id"], record["revoked_at"])
+
+def is_token_revoked(payload: dict):
+    revoked_at = revoked_users.get(payload["sub"])
+    return revoked_at is not None and payload.get("iat", 0) <= revoked_at
+
+def hash_refresh_token(token: str):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+async def issue_refresh_token(user_id: str):
+    """Create an opaque refresh token; only its SHA-256 is stored"""
+    token = secrets.token_urlsafe(48)
+    now = datetime.utcnow()
+    await db.refresh_tokens.insert_one({
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "token_hash": hash_refresh_token(token),
+        "created_at": now,
+        "expires_at": now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+        "revoked_at": None
+    })
+    return token
+
+class RevocationFilter:
+    """Bloom filter of revoked access-token ids, rebuilt from the revoked_tokens collection"""
+    
+    def __init__(self):
+        self.bloom = BloomFilter(REVOCATION_FILTER_CAPACITY)
+        self.rebuilt_at = None
+        self.confirm_lookups = 0
+        # Local revocations newer than the last rebuild start, re-added after a swap
+        self._recent = {}
+    
+    def add(self, jti: str):
+        self.bloom.add(jti)
+        self._recent[jti] = time.monotonic()
+    
+    async def is_revoked(self, jti: str):
+        if jti not in self.bloom:
+            return False
+        # Possible false positive: confirm against the source of truth (rare, off the common path)
+        self.confirm_lookups += 1
+        return await db.revoked_tokens.find_one({"jti": jti}, {"_id": 1}) is not None
+    
+    async def rebuild(self):
+        started = time.monotonic()
+        active = {"expires_at": {"$gt": datetime.utcnow()}}
+        count = await db.revoked_tokens.count_documents(active)
+        bloom = BloomFilter(max(REVOCATION_FILTER_CAPACITY, count * 2))
+        async for record in db.revoked_tokens.find(active, {"_id": 0, "jti": 1}):
+            bloom.add(record["jti"])
+        
+        self._recent = {jti: at for jti, at in self._recent.items() if at >= started}
+        for jti in self._recent:
+            bloom.add(jti)
+        self.bloom = bloom
+        self.rebuilt_at = datetime.utcnow()
+    
+    def stats(self):
+        return {
+            "entries": len(self.bloom),
+            "capacity": self.bloom.capacity,
+            "confirm_lookups": self.confirm_lookups,
+            "rebuilt_at": self.rebuilt_at
+        }
+
+revocation_filter = RevocationFilter()
+
+async def revoke_access_token(payload: dict):
+    jti = payload.get("jti")
+    if not jti:
+        return
+    await db.revoked_tokens.update_one(
+        {"jti": jti},
+        {"$setOnInsert": {
+            "jti": jti,
+            "user_id": payload["sub"],
+            "expires_at": datetime.utcfromtimestamp(payload["exp"])
+        }},
+        upsert=True
+    )
+    revocation_filter.add(jti)
+
+def encode_cursor(created_at, item_id: str, score: Optional[float] = None):
+    """Encode a (created_at, id) keyset position as an opaque URL-safe token
+    
+    Relevance-ranked search pages also carry the score of the last item; created_at
+    is then the time the ranking was computed at.
+    """
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    position = {"t": created_at, "id": item_id}
+    if score is not None:
+        position["s"] = score
+    raw = json.dumps(position, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(data["t"]), str(data["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def decode_ranked_cursor(cursor: str):
+    """Decode a relevance cursor into (ranked_at, score, id)"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(data["t"]), float(data["s"]), str(data["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def keyset_filter(cursor: str, descending: bool = True):
+    """Match documents strictly after the cursor position in (created_at, id) order"""
+    created_at, item_id = decode_cursor(cursor)
+    op = "$lt" if descending else "$gt"
+    return {
+        "$or": [
+            {"created_at": {op: created_at}},
+            {"created_at": created_at, "id": {op: item_id}}
+        ]
+    }
+
+def author_snapshot(user) -> Dict[str, Any]:
+    if isinstance(user, BaseModel):
+        user = user.dict()
+    return {field: user.get(field) for field in AUTHOR_SNAPSHOT_FIELDS}
+
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+# The only types media is ever stored or served as
+IMAGE_CONTENT_TYPES = {"image/png", "image/jpeg", "image/gif", "image/webp"}
+
+def sniff_image_type(data: bytes):
+    for signature, content_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return content_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+async def store_image(value: Optional[str]):
+    """Move a base64 (or data URL) image into the blob store and return its media URL"""
+    if not value or value.startswith(MEDIA_BASE_URL) or value.startswith(("http://", "https://")):
+        return value
+    
+    # The declared data-URL type is ignored: only the bytes decide what is stored
+    payload = value
+    if value.startswith("data:"):
+        payload = value.partition(",")[2]
+    try:
+        data = base64.b64decode(payload, validate=True)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Image must be base64 encoded"
+        )
+    if len(data) > MAX_IMAGE_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Image must be at most {MAX_IMAGE_BYTES // (1024 * 1024)} MB"
+        )
+    
+    content_type = sniff_image_type(data)
+    if content_type is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Image must be a PNG, JPEG, GIF or WebP file"
+        )
+    digest = await blob_store.put(data, content_type)
+    return f"{MEDIA_BASE_URL}/{digest}"
+
+def parse_byte_range(range_header: str, size: int):
+    """Parse a single "bytes=" range into inclusive (start, end), or None if unsatisfiable"""
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    start_text, _, end_text = spec.strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = min(int(end_text), size - 1) if end_text else size - 1
+        else:
+            start = max(size - int(end_text), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        return None
+    return start, end
+
 def generate_verification_code():
     return ''.join([str(secrets.randbelow(10)) for _ in range(6)])
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def decode_access_token(token: str):
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=["HS256"])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials",
-            )
-        
-        user = await db.users.find_one({"id": user_id})
-        if user is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User not found",
-            )
-        return User(**user)
+        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
     except jwt.PyJWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
         )
+    if payload.get("sub") is None or is_token_revoked(payload):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+        )
+    if payload.get("jti") and await revocation_filter.is_revoked(payload["jti"]):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+        )
+    return payload
+
+# Credentials are co-located on the user document; keep them out of every other read
+USER_PROJECTION = {"_id": 0, "password_hash": 0}
+
+async def load_user(user_id: str):
+    cached_user = user_cache.get(user_id)
+    if cached_user is not None:
+        return cached_user
+    
+    user = await db.users.find_one({"id": user_id}, USER_PROJECTION)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found",
+        )
+    current_user = User(**user)
+    user_cache.set(user_id, current_user)
+    return current_user
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    payload = await decode_access_token(credentials.credentials)
+    return await load_user(payload["sub"])
+
+async def get_request_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """
+    Identity for routes that only need id, name, department, year and avatar.
+    In claims mode it comes from the token alone, without touching Mongo.
+    """
+    payload = await decode_access_token(credentials.credentials)
+    if AUTH_TOKEN_MODE == "claims" and "name" in payload:
+        return TokenUser(
+            id=payload["sub"],
+            name=payload["name"],
+            department=payload["department"],
+            year=payload["year"],
+            is_verified=payload.get("verified", False),
+            profile_image=payload.get("profile_image")
+        )
+    return await load_user(payload["sub"])
+
+async def resolve_engagement_flags(posts: List[Dict[str, Any]], user_id: str):
+    """Set is_liked/is_bookmarked on a page of posts with one query per collection"""
+    post_ids = [post["id"] for post in posts]
+    if not post_ids:
+        return posts
+    
+    engagement_filter = {"post_id": {"$in": post_ids}, "user_id": user_id}
+    likes, bookmarks = await asyncio.gather(
+        db.post_likes.find(engagement_filter, {"_id": 0, "post_id": 1}).to_list(length=None),
+        db.post_bookmarks.find(engagement_filter, {"_id": 0, "post_id": 1}).to_list(length=None)
+    )
+    liked_ids = {like["post_id"] for like in likes}
+    bookmarked_ids = {bookmark["post_id"] for bookmark in bookmarks}
+    
+    for post in posts:
+        post["is_liked"] = post["id"] in liked_ids
+        post["is_bookmarked"] = post["id"] in bookmarked_ids
+    return posts
+
+async def set_engagement(collection, post_id: str, user_id: str, active: Optional[bool] = None):
+    """Atomically set (or toggle, when active is None) a like/bookmark; returns (active, changed)
+    
+    Both writes are single-document and keyed on the unique (post_id, user_id)
+    index, so concurrent requests can never create duplicates and exactly one of
+    them reports changed=True for each state transition.
+    """
+    key = {"post_id": post_id, "user_id": user_id}
+    if not active:
+        result = await collection.delete_one(key)
+        if result.deleted_count:
+            return False, True
+        if active is False:
+            return False, False
+    
+    try:
+        result = await collection.update_one(
+            key,
+            {"$setOnInsert": {"id": str(uuid.uuid4()), "created_at": datetime.utcnow()}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # A concurrent upsert of the same pair won the race
+        return True, False
+    return True, result.upserted_id is not None
+
+async def increment_post_counter(post_id: str, field: str, delta: int = 1):
+    if COUNTER_FLUSH_INTERVAL_MS > 0:
+        post_counters.incr(post_id, field, delta)
+    else:
+        await db.posts.update_one({"id": post_id}, {"$inc": {field: delta}})
+
+async def apply_post_counter_deltas(field: str, deltas: Dict[str, int]):
+    """One counter update per post, buffered or as a single bulk_write"""
+    deltas = {post_id: delta for post_id, delta in deltas.items() if delta}
+    if COUNTER_FLUSH_INTERVAL_MS > 0:
+        for post_id, delta in deltas.items():
+            post_counters.incr(post_id, field, delta)
+    elif deltas:
+        await db.posts.bulk_write([
+            UpdateOne({"id": post_id}, {"$inc": {field: delta}})
+            for post_id, delta in deltas.items()
+        ], ordered=False)
+
+async def hydrate_missing_authors(items: List[Dict[str, Any]], fields: List[str]):
+    """Fill author snapshots for documents written before snapshots existed, dropping orphans"""
+    missing_ids = list({item["user_id"] for item in items if not item.get("user")})
+    if not missing_ids:
+        return items
+    
+    projection = {"_id": 0, "id": 1, **{field: 1 for field in fields}}
+    users = await db.users.find({"id": {"$in": missing_ids}}, projection).to_list(length=None)
+    users_by_id = {user["id"]: {field: user.get(field) for field in fields} for user in users}
+    
+    hydrated = []
+    for item in items:
+        if not item.get("user"):
+            if item["user_id"] not in users_by_id:
+                continue
+            item["user"] = users_by_id[item["user_id"]]
+        hydrated.append(item)
+    return hydrated
+
+def comment_ring_entry(comment: Dict[str, Any]) -> Dict[str, Any]:
+    """Preview kept in a post's recent_comments ring; user_id is kept for snapshot propagation"""
+    return {
+        "id": comment["id"],
+        "user_id": comment["user_id"],
+        "content": comment["content"],
+        "created_at": comment["created_at"],
+        "user": {field: comment["user"].get(field) for field in COMMENT_USER_FIELDS}
+    }
+
+async def load_recent_comments(post_ids: List[str], per_post: int = RECENT_COMMENTS_LENGTH, with_user_id: bool = False):
+    """Fetch the latest comments for a page of posts, oldest first per post
+    
+    One aggregation for the whole page: a correlated $lookup reads the top per_post
+    entries of each post's (post_id, created_at, id) index range, so cost does not
+    grow with thread length or take a round trip per post.
+    """
+    if not post_ids:
+        return {}
+    
+    projection = {
+        "_id": 0, "post_id": 1, "id": 1, "user_id": 1, "content": 1, "created_at": 1,
+        **{f"user.{field}": 1 for field in COMMENT_USER_FIELDS}
+    }
+    pipeline = [
+        {"$match": {"id": {"$in": post_ids}}},
+        {"$project": {"_id": 0, "id": 1}},
+        {"$lookup": {
+            "from": "comments",
+            "let": {"post_id": "$id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$post_id", "$$post_id"]}}},
+                {"$sort": {"created_at": -1, "id": -1}},
+                {"$limit": per_post},
+                {"$project": projection}
+            ],
+            "as": "comments"
+        }}
+    ]
+    rows = [row async for post in db.posts.aggregate(pipeline) for row in post["comments"]]
+    rows = await hydrate_missing_authors(rows, COMMENT_USER_FIELDS)
+    
+    comments_by_post = {post_id: [] for post_id in post_ids}
+    for row in rows:
+        post_id = row.pop("post_id")
+        if not with_user_id:
+            del row["user_id"]
+        row["user"] = {field: row["user"].get(field) for field in COMMENT_USER_FIELDS}
+        comments_by_post[post_id].append(row)
+    for post_id, comments in comments_by_post.items():
+        comments_by_post[post_id] = comments[::-1]  # Reverse to show oldest first
+    return comments_by_post
 
 # Mock email sending function (replace with real email service in production)
 async def send_verification_email(email: str, code: str):
@@ -191,20 +765,24 @@ async def send_verification_email(email: str, code: str):
     print(f"📧 VERIFICATION CODE for {email}: {code}")
     print(f"📧 In a real application, this would be sent via email service")
     
-    # Store verification code in database
+    # Store verification code in database; a TTL index on expires_at removes it afterwards
+    now = datetime.utcnow()
     await db.verification_codes.insert_one({
         "email": email,
         "code": code,
-        "created_at": datetime.utcnow(),
-        "expires_at": datetime.utcnow() + timedelta(minutes=15)
+        "created_at": now,
+        "expires_at": now + VERIFICATION_CODE_TTL
     })
     
     # For demo purposes, also store in a simple collection for easy retrieval
-    await db.demo_codes.insert_one({
-        "email": email,
-        "code": code,
-        "message": f"Your verification code is: {code}"
-    })
+    if DEMO_MODE:
+        await db.demo_codes.insert_one({
+            "email": email,
+            "code": code,
+            "message": f"Your verification code is: {code}",
+            "created_at": now,
+            "expires_at": now + VERIFICATION_CODE_TTL
+        })
 
 # Authentication Routes
 @api_router.post("/auth/register")
@@ -226,7 +804,7 @@ async def register(user_data: UserRegistration, background_tasks: BackgroundTask
         )
     
     # Hash password
-    hashed_password = pwd_context.hash(user_data.password)
+    hashed_password = await password_hasher.hash(user_data.password)
     
     # Create user
     user = User(
@@ -238,12 +816,8 @@ async def register(user_data: UserRegistration, background_tasks: BackgroundTask
         is_verified=False
     )
     
-    # Store user and password
-    await db.users.insert_one(user.dict())
-    await db.user_passwords.insert_one({
-        "user_id": user.id,
-        "password_hash": hashed_password
-    })
+    # Store user with its password hash so login needs a single lookup
+    await db.users.insert_one({**user.dict(), "password_hash": hashed_password})
     
     # Generate and send verification code
     verification_code = generate_verification_code()
@@ -267,10 +841,13 @@ async def verify_email(verification_data: EmailVerification):
         )
     
     # Update user verification status
-    await db.users.update_one(
+    user = await db.users.find_one_and_update(
         {"email": verification_data.email},
-        {"$set": {"is_verified": True}}
+        {"$set": {"is_verified": True}},
+        projection={"id": 1}
     )
+    if user:
+        user_cache.delete(user["id"])
     
     # Delete verification code
     await db.verification_codes.delete_one({"_id": code_record["_id"]})
@@ -279,7 +856,7 @@ async def verify_email(verification_data: EmailVerification):
 
 @api_router.post("/auth/login")
 async def login(login_data: UserLogin):
-    # Find user
+    # Find user and credentials in one round trip
     user = await db.users.find_one({"email": login_data.email})
     if not user:
         raise HTTPException(
@@ -293,23 +870,76 @@ async def login(login_data: UserLogin):
             detail="Please verify your email first"
         )
     
-    # Check password
-    password_record = await db.user_passwords.find_one({"user_id": user["id"]})
-    if not password_record or not pwd_context.verify(login_data.password, password_record["password_hash"]):
+    # Check password; accounts not yet migrated still keep it in user_passwords
+    password_hash = user.get("password_hash")
+    if password_hash is None:
+        password_record = await db.user_passwords.find_one({"user_id": user["id"]})
+        password_hash = password_record["password_hash"] if password_record else None
+    if not password_hash or not await password_hasher.verify(login_data.password, password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
         )
     
     # Create access token
-    access_token = create_access_token(data={"sub": user["id"]})
+    current_user = User(**user)
+    access_token = issue_access_token(current_user)
     
     return {
         "access_token": access_token,
+        "refresh_token": await issue_refresh_token(current_user.id),
         "token_type": "bearer",
-        "user": User(**user).dict()
+        "user": current_user.dict()
     }
 
+@api_router.post("/auth/refresh")
+async def refresh_access_token(refresh_data: RefreshTokenRequest):
+    # Rotate atomically: the presented token is spent whether or not the client gets the reply
+    now = datetime.utcnow()
+    token_hash = hash_refresh_token(refresh_data.refresh_token)
+    record = await db.refresh_tokens.find_one_and_update(
+        {"token_hash": token_hash, "revoked_at": None, "expires_at": {"$gt": now}},
+        {"$set": {"revoked_at": now}}
+    )
+    
+    if record is None:
+        # Replaying an already rotated token means it leaked: end every session of that user
+        reused = await db.refresh_tokens.find_one({"token_hash": token_hash, "revoked_at": {"$ne": None}})
+        if reused:
+            logger.warning("Refresh token reuse for user %s, revoking all sessions", reused["user_id"])
+            await db.refresh_tokens.update_many(
+                {"user_id": reused["user_id"], "revoked_at": None},
+                {"$set": {"revoked_at": now}}
+            )
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token"
+        )
+    
+    # Sliding session: every refresh issues a new refresh token with a full lifetime
+    current_user = await load_user(record["user_id"])
+    return {
+        "access_token": issue_access_token(current_user),
+        "refresh_token": await issue_refresh_token(current_user.id),
+        "token_type": "bearer"
+    }
+
+@api_router.post("/auth/logout")
+async def logout(
+    logout_data: Optional[LogoutRequest] = None,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    payload = await decode_access_token(credentials.credentials)
+    await revoke_access_token(payload)
+    
+    if logout_data and logout_data.refresh_token:
+        await db.refresh_tokens.update_one(
+            {"token_hash": hash_refresh_token(logout_data.refresh_token), "user_id": payload["sub"]},
+            {"$set": {"revoked_at": datetime.utcnow()}}
+        )
+    
+    return {"message": "Logged out successfully"}
+
 # User Routes
 @api_router.get("/users/me", response_model=User)
 async def get_current_user_profile(current_user: User = Depends(get_current_user)):
@@ -317,6 +947,7 @@ async def get_current_user_profile(current_user: User = Depends(get_current_user
 
 @api_router.put("/users/me")
 async def update_profile(
+    background_tasks: BackgroundTasks,
     name: Optional[str] = None,
     bio: Optional[str] = None,
     profile_image: Optional[str] = None,
@@ -328,246 +959,808 @@ async def update_profile(
     if bio is not None:
         update_data["bio"] = bio
     if profile_image is not None:
-        update_data["profile_image"] = profile_image
+        update_data["profile_image"] = await store_image(profile_image)
     
     if update_data:
         await db.users.update_one(
             {"id": current_user.id},
             {"$set": update_data}
         )
+        user_cache.delete(current_user.id)
+        snapshot_changes = {
+            f"user.{field}": value for field, value in update_data.items()
+            if field in AUTHOR_SNAPSHOT_FIELDS
+        }
+        if snapshot_changes:
+            background_tasks.add_task(propagate_author_snapshot, current_user.id, snapshot_changes)
+            schedule_snapshot_repair(current_user.id)
+            
+            # Claims tokens carry the old name/avatar: revoke them and hand out a fresh one
+            if AUTH_TOKEN_MODE == "claims":
+                await revoke_user_tokens(current_user.id)
+                updated_user = current_user.copy(update=update_data)
+                return {
+                    "message": "Profile updated successfully",
+                    "access_token": issue_access_token(updated_user),
+                    "token_type": "bearer"
+                }
     
     return {"message": "Profile updated successfully"}
 
+async def propagate_author_snapshot(user_id: str, snapshot_changes: Dict[str, Any]):
+    """Background job: rewrite the author snapshot embedded in a user's posts and comments"""
+    await db.posts.update_many({"user_id": user_id}, {"$set": snapshot_changes})
+    await db.comments.update_many({"user_id": user_id}, {"$set": snapshot_changes})
+    
+    # Comment previews embedded in other users' posts carry the comment fields only
+    ring_changes = {
+        f"recent_comments.$[entry].{path}": value
+        for path, value in snapshot_changes.items()
+        if path.split(".", 1)[1] in COMMENT_USER_FIELDS
+    }
+    if ring_changes:
+        await db.posts.update_many(
+            {"recent_comments.user_id": user_id},
+            {"$set": ring_changes},
+            array_filters=[{"entry.user_id": user_id}]
+        )
+    
+    # Cached posts and comments embed the author's name and avatar
+    await feed_cache.invalidate_all()
+
+snapshot_repairs = set()
+
+async def repair_author_snapshot(user_id: str):
+    """Re-propagate the author's current profile once no worker can still hold the old one"""
+    await asyncio.sleep(SNAPSHOT_REPAIR_DELAY_SECONDS)
+    try:
+        # Read the profile now, so a later change is never overwritten by this older one
+        user = await db.users.find_one({"id": user_id}, {"_id": 0, **{field: 1 for field in AUTHOR_SNAPSHOT_FIELDS}})
+        if user is not None:
+            await propagate_author_snapshot(user_id, {
+                f"user.{field}": user.get(field) for field in AUTHOR_SNAPSHOT_FIELDS if field != "id"
+            })
+    except Exception:
+        logger.exception("Author snapshot repair failed for user %s", user_id)
+
+def schedule_snapshot_repair(user_id: str):
+    task = asyncio.create_task(repair_author_snapshot(user_id))
+    snapshot_repairs.add(task)
+    task.add_done_callback(snapshot_repairs.discard)
+
+async def migrate_inline_images(batch_size: int = 100):
+    """Move base64 images still embedded in posts and user profiles into the blob store"""
+    inline_filter = {"$type": "string", "$not": {"$regex": f"^({re.escape(MEDIA_BASE_URL)}|https?://)"}}
+    migrated = {}
+    for collection, field in ((db.posts, "image"), (db.users, "profile_image")):
+        migrated[collection.name] = 0
+        last_id = None
+        while True:
+            batch_filter = {field: inline_filter}
+            if last_id is not None:
+                batch_filter["_id"] = {"$gt": last_id}
+            docs = await collection.find(batch_filter, {"_id": 1, "id": 1, field: 1}) \
+                .sort("_id", 1) \
+                .limit(batch_size) \
+                .to_list(length=batch_size)
+            if not docs:
+                break
+            last_id = docs[-1]["_id"]
+            
+            updates = []
+            for doc in docs:
+                try:
+                    url = await store_image(doc[field])
+                except HTTPException as exc:
+                    logger.warning("Skipping %s %s: %s", collection.name, doc.get("id"), exc.detail)
+                    continue
+                updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": {field: url}}))
+                if field == "profile_image":
+                    await propagate_author_snapshot(doc["id"], {"user.profile_image": url})
+            if updates:
+                await collection.bulk_write(updates, ordered=False)
+            migrated[collection.name] += len(updates)
+    
+    await feed_cache.invalidate_all()
+    return migrated
+
+async def migrate_credentials(batch_size: int = 500):
+    """Copy password hashes from user_passwords onto the user documents"""
+    migrated = 0
+    last_id = None
+    while True:
+        batch_filter = {}
+        if last_id is not None:
+            batch_filter["_id"] = {"$gt": last_id}
+        records = await db.user_passwords.find(batch_filter) \
+            .sort("_id", 1) \
+            .limit(batch_size) \
+            .to_list(length=batch_size)
+        if not records:
+            break
+        last_id = records[-1]["_id"]
+        
+        # Never overwrite a hash written since (new registration or password change)
+        result = await db.users.bulk_write([
+            UpdateOne(
+                {"id": record["user_id"], "password_hash": {"$exists": False}},
+                {"$set": {"password_hash": record["password_hash"]}}
+            )
+            for record in records
+        ], ordered=False)
+        migrated += result.modified_count
+    
+    return migrated
+
+COUNTER_FIELDS = {"likes_count": "post_likes", "comments_count": "comments"}
+
+async def find_counter_drift(posts: List[Dict[str, Any]]):
+    """Compare stored counters with counts recomputed from post_likes and comments"""
+    match = {"$match": {"post_id": {"$in": [post["id"] for post in posts]}}}
+    group = {"$group": {"_id": "$post_id", "count": {"$sum": 1}}}
+    results = await asyncio.gather(*(
+        db[collection].aggregate([match, group]).to_list(length=None)
+        for collection in COUNTER_FIELDS.values()
+    ))
+    counts = {
+        field: {doc["_id"]: doc["count"] for doc in docs}
+        for field, docs in zip(COUNTER_FIELDS, results)
+    }
+    
+    drift = {}
+    for post in posts:
+        observed = {field: post.get(field) for field in COUNTER_FIELDS}
+        actual = {field: counts[field].get(post["id"], 0) for field in COUNTER_FIELDS}
+        if any((observed[field] or 0) != actual[field] for field in COUNTER_FIELDS):
+            drift[post["id"]] = (observed, actual)
+    return drift
+
+async def reconcile_post_counters(batch_size: int = 500, settle_seconds: float = None):
+    """Recompute likes_count/comments_count in _id-ordered batches and repair posts that drifted"""
+    if settle_seconds is None:
+        settle_seconds = RECONCILE_SETTLE_SECONDS
+    started = time.monotonic()
+    report = {"scanned": 0, "drifted": 0, "repaired": 0, **{f"{field}_drift": 0 for field in COUNTER_FIELDS}}
+    projection = {"_id": 1, "id": 1, **{field: 1 for field in COUNTER_FIELDS}}
+    
+    await post_counters.flush()
+    last_id = None
+    while True:
+        batch_filter = {}
+        if last_id is not None:
+            batch_filter["_id"] = {"$gt": last_id}
+        posts = await db.posts.find(batch_filter, projection) \
+            .sort("_id", 1) \
+            .limit(batch_size) \
+            .to_list(length=batch_size)
+        if not posts:
+            break
+        last_id = posts[-1]["_id"]
+        report["scanned"] += len(posts)
+        
+        drift = await find_counter_drift(posts)
+        if not drift:
+            continue
+        
+        # Increments still buffered by a worker look like drift: only repair what persists
+        await asyncio.sleep(settle_seconds)
+        await post_counters.flush()
+        rechecked = await db.posts.find({"id": {"$in": list(drift)}}, projection).to_list(length=None)
+        confirmed = {
+            post_id: counters
+            for post_id, counters in (await find_counter_drift(rechecked)).items()
+            if counters == drift[post_id]
+        }
+        if not confirmed:
+            continue
+        
+        report["drifted"] += len(confirmed)
+        for observed, actual in confirmed.values():
+            for field in COUNTER_FIELDS:
+                report[f"{field}_drift"] += abs(actual[field] - (observed[field] or 0))
+        
+        # Conditional on the observed values, so a concurrent flush is never overwritten
+        result = await db.posts.bulk_write([
+            UpdateOne({"id": post_id, **observed}, {"$set": actual})
+            for post_id, (observed, actual) in confirmed.items()
+        ], ordered=False)
+        report["repaired"] += result.modified_count
+    
+    if report["repaired"]:
+        await feed_cache.invalidate_all()
+    report["duration_ms"] = round((time.monotonic() - started) * 1000, 2)
+    report["finished_at"] = datetime.utcnow()
+    logger.info("Counter reconciliation: %s", report)
+    
+    last_reconciliation.clear()
+    last_reconciliation.update(report)
+    return report
+
+async def purge_unexpiring_codes():
+    """Delete codes written before expires_at existed; the TTL indexes never remove them"""
+    purged = {}
+    for collection in (db.verification_codes, db.demo_codes):
+        result = await collection.delete_many({"expires_at": {"$exists": False}})
+        purged[collection.name] = result.deleted_count
+    return purged
+
+async def rebuild_comment_rings(batch_size: int = 500):
+    """Regenerate every post's recent_comments ring from the comments collection"""
+    rebuilt = 0
+    last_id = None
+    while True:
+        batch_filter = {}
+        if last_id is not None:
+            batch_filter["_id"] = {"$gt": last_id}
+        posts = await db.posts.find(batch_filter, {"_id": 1, "id": 1}) \
+            .sort("_id", 1) \
+            .limit(batch_size) \
+            .to_list(length=batch_size)
+        if not posts:
+            break
+        last_id = posts[-1]["_id"]
+        
+        comments_by_post = await load_recent_comments([post["id"] for post in posts], with_user_id=True)
+        await db.posts.bulk_write([
+            UpdateOne({"_id": post["_id"]}, {"$set": {"recent_comments": comments_by_post[post["id"]]}})
+            for post in posts
+        ], ordered=False)
+        rebuilt += len(posts)
+    
+    await feed_cache.invalidate_all()
+    return rebuilt
+
+async def rebuild_search_index(batch_size: int = 500):
+    """Re-create the search postings and term statistics from every post"""
+    await search_index.clear()
+    indexed = 0
+    last_id = None
+    while True:
+        batch_filter = {}
+        if last_id is not None:
+            batch_filter["_id"] = {"$gt": last_id}
+        posts = await db.posts.find(batch_filter, {"_id": 1, "id": 1, "content": 1, "tags": 1, "created_at": 1, "user": 1}) \
+            .sort("_id", 1) \
+            .limit(batch_size) \
+            .to_list(length=batch_size)
+        if not posts:
+            break
+        last_id = posts[-1]["_id"]
+        
+        for post in posts:
+            await search_index.index_post(post)
+        indexed += len(posts)
+    
+    return indexed
+
+async def backfill_author_snapshots(batch_size: int = 500):
+    """Embed author snapshots into posts and comments written before they existed"""
+    updated = {}
+    for collection in (db.posts, db.comments):
+        updated[collection.name] = 0
+        last_id = None
+        while True:
+            batch_filter = {"user": {"$exists": False}}
+            if last_id is not None:
+                batch_filter["_id"] = {"$gt": last_id}
+            docs = await collection.find(batch_filter, {"_id": 1, "user_id": 1}) \
+                .sort("_id", 1) \
+                .limit(batch_size) \
+                .to_list(length=batch_size)
+            if not docs:
+                break
+            last_id = docs[-1]["_id"]
+            
+            user_ids = list({doc["user_id"] for doc in docs})
+            users = await db.users.find({"id": {"$in": user_ids}}).to_list(length=None)
+            snapshots = {user["id"]: author_snapshot(user) for user in users}
+            
+            # Orphans get an explicit null so later runs skip them; the dotted read
+            # projections omit a null user, so reads still look them up and drop them
+            await collection.bulk_write([
+                UpdateOne({"_id": doc["_id"]}, {"$set": {"user": snapshots.get(doc["user_id"])}})
+                for doc in docs
+            ], ordered=False)
+            updated[collection.name] += len(docs)
+    
+    await feed_cache.invalidate_all()
+    return updated
+
 # Post Routes
 @api_router.post("/posts")
-async def create_post(post_data: PostCreate, current_user: User = Depends(get_current_user)):
+async def create_post(
+    post_data: PostCreate,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_request_user)
+):
     post = Post(
         user_id=current_user.id,
+        user=author_snapshot(current_user),
         content=post_data.content,
-        image=post_data.image,
+        image=await store_image(post_data.image),
         tags=post_data.tags
     )
     
     await db.posts.insert_one(post.dict())
+    await feed_cache.invalidate_pages()
+    background_tasks.add_task(search_index.index_post, post.dict())
+    if FEED_MODE == "timeline":
+        background_tasks.add_task(fan_out_post, post.id, post.created_at, current_user.department)
     return {"message": "Post created successfully", "post_id": post.id}
 
-@api_router.get("/posts")
-async def get_posts(
-    skip: int = 0,
-    limit: int = 20,
-    current_user: User = Depends(get_current_user)
-):
-    # Get posts with user information
-    pipeline = [
-        {"$sort": {"created_at": -1}},
-        {"$skip": skip},
-        {"$limit": limit},
-        {
-            "$lookup": {
-                "from": "users",
-                "localField": "user_id",
-                "foreignField": "id",
-                "as": "user"
-            }
-        },
-        {"$unwind": "$user"},
-        {
-            "$project": {
-                "_id": 0,
-                "id": 1,
-                "user_id": 1,
-                "content": 1,
-                "image": 1,
-                "tags": 1,
-                "likes_count": 1,
-                "comments_count": 1,
-                "shares_count": 1,
-                "created_at": 1,
-                "updated_at": 1,
-                "user.id": 1,
-                "user.name": 1,
-                "user.department": 1,
-                "user.year": 1,
-                "user.profile_image": 1
-            }
-        }
-    ]
+async def query_feed_page(skip: int, limit: int, cursor: Optional[str], department: Optional[str]):
+    """Read a feed page straight from the posts collection; returns (posts, next_cursor)"""
+    match = keyset_filter(cursor) if cursor else {}
+    if department:
+        match["user.department"] = department.upper()
+    
+    # Keyset pagination: a cursor supersedes skip, which is kept for older clients
+    pipeline = []
+    if match:
+        pipeline.append({"$match": match})
+    pipeline.append({"$sort": {"created_at": -1, "id": -1}})
+    if skip and cursor is None:
+        pipeline.append({"$skip": skip})
+    pipeline.append({"$limit": limit})
+    
+    # Posts carry their author snapshot, so no users $lookup is needed
+    pipeline.append({"$project": POST_PROJECTION})
     
     posts = await db.posts.aggregate(pipeline).to_list(length=limit)
     
-    # Serialize any remaining ObjectIds
-    posts = serialize_object_ids(posts)
+    # The cursor comes from the raw page: dropping orphaned posts must not end pagination
+    next_cursor = None
+    if len(posts) == limit:
+        next_cursor = encode_cursor(posts[-1]["created_at"], posts[-1]["id"])
+    post_counters.overlay(posts)
+    return await hydrate_missing_authors(posts, AUTHOR_SNAPSHOT_FIELDS), next_cursor
+
+async def fetch_posts_by_ids(post_ids: List[str], projection: Dict[str, Any] = POST_PROJECTION):
+    """Load posts with user information, keeping the order of post_ids"""
+    if not post_ids:
+        return []
+    posts = await db.posts.find({"id": {"$in": post_ids}}, projection).to_list(length=len(post_ids))
+    post_counters.overlay(posts)
+    posts = await hydrate_missing_authors(posts, AUTHOR_SNAPSHOT_FIELDS)
+    posts_by_id = {post["id"]: post for post in posts}
+    return [posts_by_id[post_id] for post_id in post_ids if post_id in posts_by_id]
+
+async def attach_recent_comments(posts: List[Dict[str, Any]]):
+    # Embedded mode renders the ring stored on the post; posts that predate rings
+    # (no recent_comments field yet) and query mode use one aggregation for the page
+    if COMMENT_PREVIEW_MODE == "embedded":
+        missing_ids = [post["id"] for post in posts if "recent_comments" not in post]
+    else:
+        missing_ids = [post["id"] for post in posts]
+    comments_by_post = await load_recent_comments(missing_ids) if missing_ids else {}
     
-    # Check if user liked or bookmarked posts
     for post in posts:
-        like = await db.post_likes.find_one({"post_id": post["id"], "user_id": current_user.id})
-        bookmark = await db.post_bookmarks.find_one({"post_id": post["id"], "user_id": current_user.id})
-        post["is_liked"] = like is not None
-        post["is_bookmarked"] = bookmark is not None
+        ring = post.pop("recent_comments", None) or []
+        if post["id"] in comments_by_post:
+            post["comments"] = comments_by_post[post["id"]]
+        else:
+            post["comments"] = [
+                {key: value for key, value in entry.items() if key != "user_id"}
+                for entry in ring
+            ]
+    return posts
+
+def timeline_id_for(department: Optional[str] = None):
+    return f"dept:{department.upper()}" if department else "all"
+
+async def seed_timeline(timeline_id: str, department: Optional[str] = None):
+    """Create a timeline from the newest posts so enabling timeline mode does not hide history"""
+    post_filter = {"user.department": department.upper()} if department else {}
+    posts = await db.posts.find(post_filter, {"_id": 0, "id": 1, "created_at": 1}) \
+        .sort([("created_at", -1), ("id", -1)]) \
+        .limit(TIMELINE_LENGTH) \
+        .to_list(length=TIMELINE_LENGTH)
+    
+    entries = [{"post_id": post["id"], "created_at": post["created_at"]} for post in posts]
+    await db.timelines.update_one(
+        {"_id": timeline_id},
+        {"$setOnInsert": {"entries": entries, "updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+async def fan_out_post(post_id: str, created_at: datetime, department: str):
+    """Background job: push a new post onto the campus-wide and department timelines"""
+    entry = {"post_id": post_id, "created_at": created_at}
+    for timeline_department in (None, department):
+        timeline_id = timeline_id_for(timeline_department)
+        if not await db.timelines.find_one({"_id": timeline_id}, {"_id": 1}):
+            await seed_timeline(timeline_id, timeline_department)
         
-        # Get recent comments
-        comments_pipeline = [
-            {"$match": {"post_id": post["id"]}},
-            {"$sort": {"created_at": -1}},
-            {"$limit": 3},
+        # The entries filter keeps the push idempotent when the seed already holds the post
+        await db.timelines.update_one(
+            {"_id": timeline_id, "entries.post_id": {"$ne": post_id}},
             {
-                "$lookup": {
-                    "from": "users",
-                    "localField": "user_id",
-                    "foreignField": "id",
-                    "as": "user"
-                }
-            },
-            {"$unwind": "$user"},
-            {
-                "$project": {
-                    "_id": 0,
-                    "id": 1,
-                    "content": 1,
-                    "created_at": 1,
-                    "user.name": 1,
-                    "user.department": 1,
-                    "user.year": 1
-                }
+                "$push": {
+                    "entries": {
+                        "$each": [entry],
+                        "$sort": {"created_at": -1, "post_id": -1},
+                        "$slice": TIMELINE_LENGTH
+                    }
+                },
+                "$set": {"updated_at": datetime.utcnow()}
             }
-        ]
-        
-        comments = await db.comments.aggregate(comments_pipeline).to_list(length=3)
-        comments = serialize_object_ids(comments)
-        post["comments"] = comments[::-1]  # Reverse to show oldest first
+        )
     
-    return JSONResponse(content=json.loads(json.dumps(posts, cls=JSONEncoder)))
+    # Pages read between the insert and this fan-out were built without the post
+    await feed_cache.invalidate_pages()
 
-@api_router.post("/posts/{post_id}/like")
-async def toggle_like(post_id: str, current_user: User = Depends(get_current_user)):
-    # Check if already liked
-    existing_like = await db.post_likes.find_one({"post_id": post_id, "user_id": current_user.id})
-    
-    if existing_like:
-        # Unlike
-        await db.post_likes.delete_one({"post_id": post_id, "user_id": current_user.id})
-        await db.posts.update_one(
-            {"id": post_id},
-            {"$inc": {"likes_count": -1}}
-        )
-        return {"message": "Post unliked", "liked": False}
+async def timeline_feed_page(skip: int, limit: int, cursor: Optional[str], department: Optional[str]):
+    """Read (posts, next_cursor) from a precomputed timeline, or None when the timeline cannot serve it"""
+    timeline = await db.timelines.find_one({"_id": timeline_id_for(department)})
+    if timeline is None:
+        return None
+    
+    entries = timeline["entries"]
+    if cursor:
+        position = decode_cursor(cursor)
+        entries = [entry for entry in entries if (entry["created_at"], entry["post_id"]) < position]
     else:
-        # Like
-        await db.post_likes.insert_one({
-            "id": str(uuid.uuid4()),
-            "post_id": post_id,
-            "user_id": current_user.id,
-            "created_at": datetime.utcnow()
-        })
-        await db.posts.update_one(
-            {"id": post_id},
-            {"$inc": {"likes_count": 1}}
-        )
+        entries = entries[skip:]
+    page = entries[:limit]
+    
+    # Past the capped tail the timeline no longer knows what comes next
+    if len(page) < limit and len(timeline["entries"]) >= TIMELINE_LENGTH:
+        return None
+    if not page:
+        return [], None
+    
+    next_cursor = None
+    if len(page) == limit:
+        next_cursor = encode_cursor(page[-1]["created_at"], page[-1]["post_id"])
+    return await fetch_posts_by_ids([entry["post_id"] for entry in page]), next_cursor
+
+@api_router.get("/posts")
+async def get_posts(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    department: Optional[str] = None,
+    current_user: User = Depends(get_request_user)
+):
+    if cursor is not None:
+        skip = 0
+    page_key = f"{FEED_MODE}:{(department or '').upper()}:{cursor or ''}:{skip}:{limit}"
+    versioned_key, page = await feed_cache.get_page(page_key)
+    
+    if page is None:
+        if FEED_MODE == "timeline":
+            page = await timeline_feed_page(skip, limit, cursor, department)
+        if page is None:
+            page = await query_feed_page(skip, limit, cursor, department)
+        posts, next_cursor = page
+        await attach_recent_comments(posts)
+        await feed_cache.set_posts(posts)
+        await feed_cache.set_page(versioned_key, [post["id"] for post in posts], next_cursor)
+    else:
+        post_ids, next_cursor = page["post_ids"], page["next_cursor"]
+        cached_posts = await feed_cache.get_posts(post_ids)
+        missing_ids = [post_id for post_id in post_ids if post_id not in cached_posts]
+        if missing_ids:
+            fresh_posts = await attach_recent_comments(await fetch_posts_by_ids(missing_ids))
+            await feed_cache.set_posts(fresh_posts)
+            cached_posts.update((post["id"], post) for post in fresh_posts)
+        posts = [cached_posts[post_id] for post_id in post_ids if post_id in cached_posts]
+    
+    # Per-user flags are overlaid on copies, cached entries stay user-independent
+    posts = [dict(post) for post in posts]
+    
+    # Check if user liked or bookmarked posts
+    await resolve_engagement_flags(posts, current_user.id)
+    
+    if cursor is not None:
+        return MongoJSONResponse(content={"posts": posts, "next_cursor": next_cursor})
+    
+    # Legacy list response; the cursor for the next page travels in a header
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return MongoJSONResponse(content=posts, headers=headers)
+
+@api_router.post("/posts/{post_id}/like")
+async def toggle_like(
+    post_id: str,
+    liked: Optional[bool] = None,
+    current_user: User = Depends(get_request_user)
+):
+    # Pass ?liked=true|false to set the state instead of toggling it (idempotent, one write)
+    liked, changed = await set_engagement(db.post_likes, post_id, current_user.id, liked)
+    
+    # Only the request that actually changed the like moves the counter
+    if changed:
+        delta = 1 if liked else -1
+        await increment_post_counter(post_id, "likes_count", delta)
+        await feed_cache.patch_post(post_id, "likes_count", delta)
+    
+    if liked:
         return {"message": "Post liked", "liked": True}
+    return {"message": "Post unliked", "liked": False}
 
 @api_router.post("/posts/{post_id}/bookmark")
-async def toggle_bookmark(post_id: str, current_user: User = Depends(get_current_user)):
-    # Check if already bookmarked
-    existing_bookmark = await db.post_bookmarks.find_one({"post_id": post_id, "user_id": current_user.id})
-    
-    if existing_bookmark:
-        # Remove bookmark
-        await db.post_bookmarks.delete_one({"post_id": post_id, "user_id": current_user.id})
-        return {"message": "Bookmark removed", "bookmarked": False}
-    else:
-        # Add bookmark
-        await db.post_bookmarks.insert_one({
-            "id": str(uuid.uuid4()),
-            "post_id": post_id,
-            "user_id": current_user.id,
-            "created_at": datetime.utcnow()
-        })
+async def toggle_bookmark(
+    post_id: str,
+    bookmarked: Optional[bool] = None,
+    current_user: User = Depends(get_request_user)
+):
+    # Pass ?bookmarked=true|false to set the state instead of toggling it
+    bookmarked, _ = await set_engagement(db.post_bookmarks, post_id, current_user.id, bookmarked)
+    
+    if bookmarked:
         return {"message": "Post bookmarked", "bookmarked": True}
+    return {"message": "Bookmark removed", "bookmarked": False}
+
+@api_router.get("/users/me/bookmarks")
+async def get_my_bookmarks(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_request_user)
+):
+    """Bookmarked posts, most recently bookmarked first, paged by (created_at, id) of the bookmark"""
+    bookmark_filter = keyset_filter(cursor) if cursor else {}
+    bookmark_filter["user_id"] = current_user.id
+    bookmarks = await db.post_bookmarks.find(bookmark_filter, {"_id": 0, "id": 1, "post_id": 1, "created_at": 1}) \
+        .sort([("created_at", -1), ("id", -1)]) \
+        .limit(limit) \
+        .to_list(length=limit)
+    
+    # One query for the whole page of posts (authors are embedded snapshots), one for comments
+    posts = await attach_recent_comments(await fetch_posts_by_ids([bookmark["post_id"] for bookmark in bookmarks]))
+    bookmarked_at = {bookmark["post_id"]: bookmark["created_at"] for bookmark in bookmarks}
+    for post in posts:
+        post["bookmarked_at"] = bookmarked_at[post["id"]]
+    await resolve_engagement_flags(posts, current_user.id)
+    
+    # The cursor follows the bookmarks, so posts deleted since do not end pagination early
+    next_cursor = None
+    if len(bookmarks) == limit:
+        next_cursor = encode_cursor(bookmarks[-1]["created_at"], bookmarks[-1]["id"])
+    
+    return {"posts": posts, "next_cursor": next_cursor}
+
+@api_router.post("/engagement/batch")
+async def apply_engagement_batch(batch: EngagementBatch, current_user: User = Depends(get_request_user)):
+    """Replay queued like/unlike/bookmark/unbookmark operations in order, with one bulk insert per collection"""
+    operations = batch.operations
+    post_ids = list({operation.post_id for operation in operations})
+    
+    # Only the last operation per (collection, post) decides the final state
+    final_index = {}
+    for index, operation in enumerate(operations):
+        collection_name, _ = ENGAGEMENT_ACTIONS[operation.action]
+        final_index[(collection_name, operation.post_id)] = index
+    
+    existing_posts, *current = await asyncio.gather(
+        db.posts.find({"id": {"$in": post_ids}}, {"_id": 0, "id": 1}).to_list(length=None),
+        *(
+            db[collection_name].find(
+                {"post_id": {"$in": post_ids}, "user_id": current_user.id}, {"_id": 0, "post_id": 1}
+            ).to_list(length=None)
+            for collection_name in ("post_likes", "post_bookmarks")
+        )
+    )
+    existing_ids = {post["id"] for post in existing_posts}
+    active = {
+        collection_name: {doc["post_id"] for doc in docs}
+        for collection_name, docs in zip(("post_likes", "post_bookmarks"), current)
+    }
+    
+    # Build the writes and remember which operation each upsert/delete belongs to
+    writes = {"post_likes": [], "post_bookmarks": []}
+    write_owner = {"post_likes": [], "post_bookmarks": []}
+    deletes = []
+    status_by_index = {}
+    for (collection_name, post_id), index in final_index.items():
+        _, target = ENGAGEMENT_ACTIONS[operations[index].action]
+        if post_id not in existing_ids:
+            status_by_index[index] = "not_found"
+        elif target == (post_id in active[collection_name]):
+            status_by_index[index] = "unchanged"
+        else:
+            key = {"post_id": post_id, "user_id": current_user.id}
+            if target:
+                writes[collection_name].append(UpdateOne(
+                    key,
+                    {"$setOnInsert": {"id": str(uuid.uuid4()), "created_at": datetime.utcnow()}},
+                    upsert=True
+                ))
+                write_owner[collection_name].append(index)
+            else:
+                deletes.append((collection_name, index, key))
+    
+    # Deletes run concurrently one by one: only a per-delete deleted_count tells
+    # which removals lost a race, so each counter moves exactly once
+    deleted = await asyncio.gather(*(
+        db[collection_name].delete_one(key) for collection_name, _, key in deletes
+    ))
+    changes = [
+        (collection_name, index, result.deleted_count == 1, -1)
+        for (collection_name, index, _), result in zip(deletes, deleted)
+    ]
+    
+    for collection_name, requests in writes.items():
+        if not requests:
+            continue
+        try:
+            result = (await db[collection_name].bulk_write(requests, ordered=False)).bulk_api_result
+        except BulkWriteError as exc:
+            # Duplicate keys are concurrent inserts of the same pair, already in the target state
+            if any(error["code"] != 11000 for error in exc.details["writeErrors"]):
+                raise
+            result = exc.details
+        
+        upserted = {item["index"] for item in result["upserted"]}
+        changes.extend(
+            (collection_name, index, position in upserted, 1)
+            for position, index in enumerate(write_owner[collection_name])
+        )
+    
+    like_deltas = {}
+    for collection_name, index, changed, delta in changes:
+        status_by_index[index] = "applied" if changed else "unchanged"
+        if changed and collection_name == "post_likes":
+            post_id = operations[index].post_id
+            like_deltas[post_id] = like_deltas.get(post_id, 0) + delta
+    
+    await apply_post_counter_deltas("likes_count", like_deltas)
+    for post_id, delta in like_deltas.items():
+        await feed_cache.patch_post(post_id, "likes_count", delta)
+    
+    return {
+        "results": [
+            {
+                "post_id": operation.post_id,
+                "action": operation.action,
+                "status": status_by_index.get(index, "superseded")
+            }
+            for index, operation in enumerate(operations)
+        ]
+    }
 
 @api_router.post("/posts/{post_id}/comments")
 async def add_comment(
     post_id: str,
-    comment_data: dict,
-    current_user: User = Depends(get_current_user)
+    comment_data: CommentCreate,
+    current_user: User = Depends(get_request_user)
 ):
     comment = Comment(
         post_id=post_id,
         user_id=current_user.id,
-        content=comment_data["content"]
+        user=author_snapshot(current_user),
+        content=comment_data.content
     )
     
     await db.comments.insert_one(comment.dict())
+    await increment_post_counter(post_id, "comments_count")
+    
+    # Keep the newest comments on the post itself, oldest first, capped at RECENT_COMMENTS_LENGTH
     await db.posts.update_one(
         {"id": post_id},
-        {"$inc": {"comments_count": 1}}
+        {
+            "$push": {
+                "recent_comments": {
+                    "$each": [comment_ring_entry(comment.dict())],
+                    "$sort": {"created_at": 1, "id": 1},
+                    "$slice": -RECENT_COMMENTS_LENGTH
+                }
+            }
+        }
     )
+    # The cached post carries both the count and the recent comments preview
+    await feed_cache.invalidate_post(post_id)
     
     return {"message": "Comment added successfully"}
 
+@api_router.get("/posts/{post_id}/comments")
+async def get_comments(
+    post_id: str,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_request_user)
+):
+    """A post's comments, oldest first, paged by (created_at, id)"""
+    comment_filter = keyset_filter(cursor, descending=False) if cursor else {}
+    comment_filter["post_id"] = post_id
+    post, comments = await asyncio.gather(
+        db.posts.find_one({"id": post_id}, {"_id": 0, "id": 1}),
+        db.comments.find(comment_filter, {"_id": 0, "id": 1, "user_id": 1, "content": 1, "created_at": 1, "user": 1})
+            .sort([("created_at", 1), ("id", 1)])
+            .limit(limit)
+            .to_list(length=limit)
+    )
+    if post is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Post not found"
+        )
+    
+    # Taken before hydration, which drops comments whose author no longer exists
+    next_cursor = None
+    if len(comments) == limit:
+        next_cursor = encode_cursor(comments[-1]["created_at"], comments[-1]["id"])
+    
+    # Same shape as the recent comments embedded in feed posts
+    comments = await hydrate_missing_authors(comments, COMMENT_USER_FIELDS)
+    for comment in comments:
+        del comment["user_id"]
+        comment["user"] = {field: comment["user"].get(field) for field in COMMENT_USER_FIELDS}
+    
+    return {"comments": comments, "next_cursor": next_cursor}
+
 # Search Routes
 @api_router.post("/search")
-async def search_posts(search_data: SearchQuery, current_user: User = Depends(get_current_user)):
-    # Build search filter
-    search_filter = {
-        "$or": [
-            {"content": {"$regex": search_data.query, "$options": "i"}},
-            {"tags": {"$in": [re.compile(search_data.query, re.IGNORECASE)]}}
-        ]
-    }
+async def search_posts(search_data: SearchQuery, current_user: User = Depends(get_request_user)):
+    # The year filter only applies together with a department
+    department = search_data.department.upper() if search_data.department else None
+    year = search_data.year if department else None
     
-    # Add department filter if specified
-    if search_data.department:
-        user_filter = {"department": search_data.department.upper()}
-        if search_data.year:
-            user_filter["year"] = search_data.year
-        
-        # Get user IDs matching the criteria
-        matching_users = await db.users.find(user_filter, {"id": 1}).to_list(length=None)
-        user_ids = [user["id"] for user in matching_users]
-        search_filter["user_id"] = {"$in": user_ids}
+    limit = search_data.limit
+    cursor = search_data.cursor
+    next_cursor = None
     
-    # Search posts
-    pipeline = [
-        {"$match": search_filter},
-        {"$sort": {"created_at": -1}},
-        {"$limit": 50},
-        {
-            "$lookup": {
-                "from": "users",
-                "localField": "user_id",
-                "foreignField": "id",
-                "as": "user"
-            }
-        },
-        {"$unwind": "$user"},
-        {
-            "$project": {
-                "_id": 0,
-                "id": 1,
-                "user_id": 1,
-                "content": 1,
-                "image": 1,
-                "tags": 1,
-                "likes_count": 1,
-                "comments_count": 1,
-                "shares_count": 1,
-                "created_at": 1,
-                "updated_at": 1,
-                "user.id": 1,
-                "user.name": 1,
-                "user.department": 1,
-                "user.year": 1,
-                "user.profile_image": 1
-            }
-        }
-    ]
+    # estimated_total comes from index statistics, never from counting matches
+    if search_data.query.strip():
+        # Every query word must match; the words are looked up in the inverted index
+        if search_data.sort == "relevance":
+            ranked_at, after = datetime.utcnow(), None
+            if cursor:
+                ranked_at, score, post_id = decode_ranked_cursor(cursor)
+                after = (score, post_id)
+            hits, estimated_total = await search_index.rank(
+                search_data.query, department, year, limit=limit, after=after, now=ranked_at
+            )
+            if len(hits) == limit:
+                next_cursor = encode_cursor(ranked_at, hits[-1]["post_id"], score=hits[-1]["score"])
+        else:
+            before = decode_cursor(cursor) if cursor else None
+            hits, estimated_total, resume_after = await search_index.search(
+                search_data.query, department, year, limit=limit, before=before
+            )
+            if len(hits) == limit:
+                next_cursor = encode_cursor(hits[-1]["created_at"], hits[-1]["post_id"])
+            elif resume_after:
+                # The scan budget ran out first: a short (even empty) page still continues
+                next_cursor = encode_cursor(*resume_after)
+        posts = await fetch_posts_by_ids([hit["post_id"] for hit in hits], SEARCH_RESULT_PROJECTION)
+    else:
+        # Filters only: newest posts of the department, served by the department feed index
+        search_filter = keyset_filter(cursor) if cursor else {}
+        if department:
+            search_filter["user.department"] = department
+            if year:
+                search_filter["user.year"] = year
+        posts = await db.posts.find(search_filter, SEARCH_RESULT_PROJECTION) \
+            .sort([("created_at", -1), ("id", -1)]) \
+            .limit(limit) \
+            .to_list(length=limit)
+        if len(posts) == limit:
+            next_cursor = encode_cursor(posts[-1]["created_at"], posts[-1]["id"])
+        estimated_total = search_index.estimate_total(
+            await search_index.statistics(), department=department, year=year
+        )
+        post_counters.overlay(posts)
+        posts = await hydrate_missing_authors(posts, AUTHOR_SNAPSHOT_FIELDS)
     
-    posts = await db.posts.aggregate(pipeline).to_list(length=50)
-    posts = serialize_object_ids(posts)
+    await resolve_engagement_flags(posts, current_user.id)
     
-    return JSONResponse(content=json.loads(json.dumps(posts, cls=JSONEncoder)))
+    if cursor is not None:
+        return MongoJSONResponse(content={"posts": posts, "next_cursor": next_cursor, "estimated_total": estimated_total})
+    
+    # Legacy list response; pagination details travel in headers
+    headers = {"X-Estimated-Total": str(estimated_total)}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return MongoJSONResponse(content=posts, headers=headers)
+
+def require_demo_mode():
+    if not DEMO_MODE:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Demo endpoints are disabled"
+        )
 
-@api_router.get("/demo/verification-code/{email}")
+@api_router.get("/demo/verification-code/{email}", dependencies=[Depends(require_demo_mode)])
 async def get_demo_verification_code(email: str):
     """Demo endpoint to get verification code for testing (remove in production)"""
     code_record = await db.demo_codes.find_one(
@@ -583,21 +1776,94 @@ async def get_demo_verification_code(email: str):
             detail="No verification code found for this email"
         )
 
-@api_router.delete("/demo/clear-user/{email}")
+@api_router.delete("/demo/clear-user/{email}", dependencies=[Depends(require_demo_mode)])
 async def clear_demo_user(email: str):
     """Demo endpoint to clear user data for testing (remove in production)"""
-    # Delete user
-    await db.users.delete_many({"email": email})
-    # Delete password
+    # Delete password (looked up before the user records are gone)
     user_records = await db.users.find({"email": email}).to_list(length=None)
     for user in user_records:
         await db.user_passwords.delete_many({"user_id": user["id"]})
+        user_cache.delete(user["id"])
+        await revoke_user_tokens(user["id"])
+    # Delete user
+    await db.users.delete_many({"email": email})
     # Clear verification codes
     await db.verification_codes.delete_many({"email": email})
     await db.demo_codes.delete_many({"email": email})
     
     return {"message": f"All data cleared for {email}"}
 
+@api_router.get("/media/{digest}")
+async def get_media(
+    digest: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match")
+):
+    if not is_valid_digest(digest):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Media not found")
+    blob = await blob_store.stat(digest)
+    if blob is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Media not found")
+    
+    # Content-addressed blobs never change, so they can be cached forever
+    etag = f'"{digest}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes",
+        "X-Content-Type-Options": "nosniff"
+    }
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    start, end = 0, blob.size - 1
+    status_code = status.HTTP_200_OK
+    if range_header:
+        byte_range = parse_byte_range(range_header, blob.size)
+        if byte_range is None:
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={**headers, "Content-Range": f"bytes */{blob.size}"}
+            )
+        start, end = byte_range
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = f"bytes {start}-{end}/{blob.size}"
+    
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        blob_store.stream(digest, start, end),
+        status_code=status_code,
+        # Blobs stored before types were checked are never served as anything active
+        media_type=blob.content_type if blob.content_type in IMAGE_CONTENT_TYPES else "application/octet-stream",
+        headers=headers
+    )
+
+def require_metrics_token(x_metrics_token: Optional[str] = Header(None)):
+    # Internals are only served when METRICS_TOKEN is configured and presented
+    if not METRICS_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Metrics are disabled"
+        )
+    if not x_metrics_token or not secrets.compare_digest(x_metrics_token, METRICS_TOKEN):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token"
+        )
+
+@api_router.get("/metrics", dependencies=[Depends(require_metrics_token)])
+async def get_metrics():
+    """Internal counters for the in-process caches and workers"""
+    return {
+        "feed_cache": feed_cache.stats(),
+        "user_cache": user_cache.stats(),
+        "password_hashing": password_hasher.stats(),
+        "revocation_filter": revocation_filter.stats(),
+        "post_counters": post_counters.stats(),
+        "counter_reconciliation": last_reconciliation,
+        "indexes": index_report
+    }
+
 @api_router.get("/departments")
 async def get_departments():
     departments = ['CSE', 'ECE', 'MECH', 'CIVIL', 'EEE', 'AIDS', 'AIML', 'IT', 'CHEMICAL']
@@ -612,6 +1878,7 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Estimated-Total"],
 )
 
 # Configure logging
@@ -621,6 +1888,57 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+index_report = {}
+last_reconciliation = {}
+background_jobs = []
+
+async def run_periodically(interval_seconds: float, job):
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await job()
+        except Exception:
+            logger.exception("Periodic job %s failed", job.__name__)
+
+@app.on_event("startup")
+async def bootstrap_indexes():
+    if AUTO_CREATE_INDEXES:
+        index_report.update(await ensure_indexes(db))
+    drift = await index_drift(db)
+    index_report["drift"] = drift
+    log_index_drift(drift)
+    
+    purged = await purge_unexpiring_codes()
+    if any(purged.values()):
+        logger.info("Purged verification codes without expires_at: %s", purged)
+    
+    if await search_index.is_empty() and await db.posts.find_one({}, {"_id": 1}):
+        logger.warning("Search index is empty: run `python manage.py rebuild-search-index` to index existing posts")
+
+@app.on_event("startup")
+async def start_background_jobs():
+    await revocation_filter.rebuild()
+    await load_revoked_users()
+    background_jobs.append(asyncio.create_task(
+        run_periodically(REVOCATION_REFRESH_SECONDS, revocation_filter.rebuild)
+    ))
+    background_jobs.append(asyncio.create_task(
+        run_periodically(REVOCATION_REFRESH_SECONDS, load_revoked_users)
+    ))
+    if COUNTER_FLUSH_INTERVAL_MS > 0:
+        background_jobs.append(asyncio.create_task(
+            run_periodically(COUNTER_FLUSH_INTERVAL_MS / 1000, post_counters.flush)
+        ))
+    if RECONCILE_INTERVAL_SECONDS > 0:
+        background_jobs.append(asyncio.create_task(
+            run_periodically(RECONCILE_INTERVAL_SECONDS, reconcile_post_counters)
+        ))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    for job in [*background_jobs, *snapshot_repairs]:
+        job.cancel()
+    # Buffered counter increments must reach Mongo before the connection goes away
+    await post_counters.flush()
+    client.close()
+    password_hasher.shutdown()
\ No newline at end of file
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Concurrency stress test for like/bookmark toggles
+Hammers one post from many threads and checks that likes_count always equals
+the number of users whose final state is "liked" (no duplicates, no drift).
+Needs a backend running with DEMO_MODE enabled (uses the demo verification code endpoint).
+"""
+
+import requests
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv('/app/frontend/.env')
+
+# Get backend URL from environment
+BACKEND_URL = os.getenv('REACT_APP_BACKEND_URL', 'https://2f02c4cf-cf77-452e-8de0-cb3ce6f5af58.preview.emergentagent.com')
+API_BASE_URL = f"{BACKEND_URL}/api"
+
+USERS = int(os.getenv('STRESS_USERS', 8))
+TOGGLES_PER_USER = int(os.getenv('STRESS_TOGGLES', 25))
+WORKERS = int(os.getenv('STRESS_WORKERS', 32))
+
+print(f"Testing backend at: {API_BASE_URL}")
+
+def create_user(run_id, index):
+    """Register, verify and log in a throwaway user; returns (email, auth headers)"""
+    email = f"stress{run_id}{index:03d}@ritrjpm.ac.in"
+    password = "stress123"
+    response = requests.post(f"{API_BASE_URL}/auth/register", json={
+        "name": f"Stress User {index}",
+        "email": email,
+        "password": password,
+        "department": "CSE",
+        "year": 2,
+        "roll_number": f"ST{run_id}{index:03d}"
+    })
+    response.raise_for_status()
+
+    code = requests.get(f"{API_BASE_URL}/demo/verification-code/{email}").json()["code"]
+    requests.post(f"{API_BASE_URL}/auth/verify-email", json={"email": email, "verification_code": code}).raise_for_status()
+
+    response = requests.post(f"{API_BASE_URL}/auth/login", json={"email": email, "password": password})
+    response.raise_for_status()
+    return email, {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def fetch_post(post_id, headers):
+    """Find the test post in the viewer's feed (it is the newest post)"""
+    response = requests.get(f"{API_BASE_URL}/posts", params={"limit": 50}, headers=headers)
+    response.raise_for_status()
+    return next(post for post in response.json() if post["id"] == post_id)
+
+def hammer(requests_to_send):
+    """Fire (url, params, headers) POSTs from a thread pool and return the status codes"""
+    def send(item):
+        url, params, headers = item
+        return requests.post(url, params=params, headers=headers).status_code
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        return list(pool.map(send, requests_to_send))
+
+def check(label, condition, details=""):
+    print(f"{'✅' if condition else '❌'} {label} {details}")
+    return condition
+
+def main():
+    run_id = uuid.uuid4().hex[:6]
+    print(f"\n=== SETUP: {USERS} users, {TOGGLES_PER_USER} toggles each ===")
+    users = [create_user(run_id, index) for index in range(USERS)]
+    headers = [user_headers for _, user_headers in users]
+
+    response = requests.post(f"{API_BASE_URL}/posts", json={"content": f"Stress test post {run_id}"}, headers=headers[0])
+    response.raise_for_status()
+    post_id = response.json()["post_id"]
+    like_url = f"{API_BASE_URL}/posts/{post_id}/like"
+    bookmark_url = f"{API_BASE_URL}/posts/{post_id}/bookmark"
+    results = []
+
+    try:
+        print("\n=== PHASE 1: concurrent toggles, interleaved across users ===")
+        # Concurrent toggles from one user can read the same state and both flip it,
+        # so each user's final state is unknown; the count must match it either way
+        statuses = hammer([(like_url, None, user_headers) for _ in range(TOGGLES_PER_USER) for user_headers in headers])
+        results.append(check("all toggles succeeded", all(code == 200 for code in statuses)))
+        liked = sum(fetch_post(post_id, user_headers)["is_liked"] for user_headers in headers)
+        post = fetch_post(post_id, headers[0])
+        results.append(check("likes_count matches liked users", post["likes_count"] == liked, f"({post['likes_count']} == {liked})"))
+
+        print("\n=== PHASE 2: duplicate explicit unlikes ===")
+        hammer([(like_url, {"liked": "false"}, user_headers) for _ in range(5) for user_headers in headers])
+        post = fetch_post(post_id, headers[0])
+        results.append(check("likes_count back to zero", post["likes_count"] == 0, f"({post['likes_count']})"))
+
+        print("\n=== PHASE 3: duplicate explicit bookmarks from one user ===")
+        hammer([(bookmark_url, {"bookmarked": "true"}, headers[0]) for _ in range(WORKERS)])
+        results.append(check("post bookmarked exactly once", fetch_post(post_id, headers[0])["is_bookmarked"]))
+    finally:
+        for email, _ in users:
+            requests.delete(f"{API_BASE_URL}/demo/clear-user/{email}")
+
+    print("\n" + "="*60)
+    print(f"{sum(results)}/{len(results)} checks passed")
+    print("="*60)
+    return all(results)
+
+if __name__ == "__main__":
+    raise SystemExit(0 if main() else 1)
@@ -0,0 +1,14 @@
+"""
+Unit tests for the backend building blocks
+The live-API scripts in the repository root need a running server; these
+import the backend modules directly. Tests that need a database use
+mongomock-motor and are skipped when it is not installed.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+# server.py reads these at import time; the client only connects on first use
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "student_media_test")
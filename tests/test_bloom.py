@@ -0,0 +1,24 @@
+from bloom import BloomFilter
+
+
+def test_added_items_are_always_found():
+    bloom = BloomFilter(1000)
+    items = [f"jti-{index}" for index in range(1000)]
+    for item in items:
+        bloom.add(item)
+    assert all(item in bloom for item in items)
+    assert len(bloom) == 1000
+
+
+def test_false_positive_rate_stays_near_the_target():
+    bloom = BloomFilter(1000, error_rate=0.01)
+    for index in range(1000):
+        bloom.add(f"in-{index}")
+    false_positives = sum(f"out-{index}" in bloom for index in range(10000))
+    assert false_positives < 300
+
+
+def test_zero_capacity_still_works():
+    bloom = BloomFilter(0)
+    bloom.add("a")
+    assert "a" in bloom
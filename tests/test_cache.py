@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+from cache import FeedCache, LRUCache, MemoryCacheBackend
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_lru_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = LRUCache(ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=100)
+    now[0] += 11
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+
+
+def test_lru_stats_count_hits_and_misses():
+    cache = LRUCache()
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("missing")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_feed_cache_page_generation_hides_stale_pages():
+    async def scenario():
+        feed_cache = FeedCache(MemoryCacheBackend())
+        key, page = await feed_cache.get_page("all:20")
+        assert page is None
+        await feed_cache.set_page(key, ["p1", "p2"], "cursor")
+        assert (await feed_cache.get_page("all:20"))[1] == {"post_ids": ["p1", "p2"], "next_cursor": "cursor"}
+
+        await feed_cache.invalidate_pages()
+        assert (await feed_cache.get_page("all:20"))[1] is None
+
+    asyncio.run(scenario())
+
+
+def test_feed_cache_patches_cached_counters():
+    async def scenario():
+        feed_cache = FeedCache(MemoryCacheBackend())
+        await feed_cache.set_posts([{"id": "p1", "likes_count": 2}])
+        await feed_cache.patch_post("p1", "likes_count", 1)
+        await feed_cache.patch_post("p2", "likes_count", 1)
+        assert await feed_cache.get_posts(["p1", "p2"]) == {"p1": {"id": "p1", "likes_count": 3}}
+
+        await feed_cache.invalidate_all()
+        assert await feed_cache.get_posts(["p1"]) == {}
+
+    asyncio.run(scenario())
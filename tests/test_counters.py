@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from counters import CounterBuffer
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+def make_buffer(**kwargs):
+    collection = mongomock_motor.AsyncMongoMockClient()["test"]["posts"]
+    return collection, CounterBuffer(collection, **kwargs)
+
+
+def test_flush_coalesces_increments_per_document():
+    async def scenario():
+        collection, buffer = make_buffer()
+        await collection.insert_many([{"id": "p1", "likes_count": 0}, {"id": "p2", "likes_count": 5}])
+        for _ in range(3):
+            buffer.incr("p1", "likes_count")
+        buffer.incr("p2", "likes_count", -1)
+
+        assert await buffer.flush() == 2
+        counts = {doc["id"]: doc["likes_count"] async for doc in collection.find()}
+        assert counts == {"p1": 3, "p2": 4}
+        assert buffer.stats()["flushed_ops"] == 4
+        assert buffer.stats()["pending_ops"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_out_increments_are_not_written():
+    async def scenario():
+        collection, buffer = make_buffer()
+        await collection.insert_one({"id": "p1", "likes_count": 1})
+        buffer.incr("p1", "likes_count")
+        buffer.incr("p1", "likes_count", -1)
+        assert await buffer.flush() == 0
+        assert (await collection.find_one({"id": "p1"}))["likes_count"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_overlay_adds_pending_deltas():
+    async def scenario():
+        _, buffer = make_buffer()
+        buffer.incr("p1", "likes_count", 2)
+        documents = buffer.overlay([{"id": "p1", "likes_count": 1}, {"id": "p2", "likes_count": 7}])
+        assert [doc["likes_count"] for doc in documents] == [3, 7]
+
+    asyncio.run(scenario())
+
+
+def test_reaching_max_pending_ops_flushes_early():
+    async def scenario():
+        collection, buffer = make_buffer(max_pending_ops=3)
+        await collection.insert_one({"id": "p1", "likes_count": 0})
+        for _ in range(3):
+            buffer.incr("p1", "likes_count")
+        await buffer._eager_flush
+        assert (await collection.find_one({"id": "p1"}))["likes_count"] == 3
+
+    asyncio.run(scenario())
+
+
+class FailingFor:
+    """Collection wrapper whose bulk_write fails the updates of one document, like a write error would"""
+
+    def __init__(self, collection, failing_key):
+        self._collection = collection
+        self._failing_key = failing_key
+
+    async def bulk_write(self, requests, ordered=True):
+        failed = [index for index, request in enumerate(requests) if request._filter["id"] == self._failing_key]
+        applied = [request for index, request in enumerate(requests) if index not in failed]
+        if applied:
+            await self._collection.bulk_write(applied, ordered=ordered)
+        if failed:
+            raise BulkWriteError({
+                "writeErrors": [{"index": index, "code": 14, "errmsg": "Cannot apply $inc"} for index in failed],
+                "nModified": len(applied)
+            })
+
+
+def test_failed_updates_are_requeued_with_their_ops():
+    async def scenario():
+        collection, _ = make_buffer()
+        buffer = CounterBuffer(FailingFor(collection, "bad"))
+        await collection.insert_many([{"id": "p1", "likes_count": 0}, {"id": "bad", "likes_count": 0}])
+        buffer.incr("p1", "likes_count")
+        for _ in range(2):
+            buffer.incr("bad", "likes_count")
+
+        assert await buffer.flush() == 1
+        stats = buffer.stats()
+        assert (stats["pending_documents"], stats["pending_ops"]) == (1, 2)
+        assert (stats["flushes"], stats["flushed_ops"], stats["flushed_documents"]) == (1, 1, 1)
+        assert stats["failed_flushes"] == 1
+        assert buffer.pending("bad") == {"likes_count": 2}
+        assert (await collection.find_one({"id": "p1"}))["likes_count"] == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,61 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+pytest.importorskip("motor")
+import server
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 3, 1, 12, 30, 5, 123000)
+    assert server.decode_cursor(server.encode_cursor(created_at, "post-1")) == (created_at, "post-1")
+
+
+def test_ranked_cursor_round_trip():
+    ranked_at = datetime(2026, 3, 1, 12, 0)
+    cursor = server.encode_cursor(ranked_at, "post-1", score=0.123456)
+    assert server.decode_ranked_cursor(cursor) == (ranked_at, 0.123456, "post-1")
+
+
+def test_cursor_is_url_safe():
+    cursor = server.encode_cursor(datetime(2026, 3, 1), "a/b+c")
+    assert "=" not in cursor and "/" not in cursor and "+" not in cursor
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "e30"])
+def test_invalid_cursor_is_a_client_error(cursor):
+    with pytest.raises(HTTPException) as error:
+        server.decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_plain_cursor_is_not_a_ranked_cursor():
+    with pytest.raises(HTTPException):
+        server.decode_ranked_cursor(server.encode_cursor(datetime(2026, 3, 1), "post-1"))
+
+
+def test_keyset_filter_matches_strictly_after_the_position():
+    created_at = datetime(2026, 3, 1)
+    cursor = server.encode_cursor(created_at, "post-1")
+    assert server.keyset_filter(cursor) == {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "id": {"$lt": "post-1"}}
+    ]}
+    assert server.keyset_filter(cursor, descending=False)["$or"][0] == {"created_at": {"$gt": created_at}}
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=95-200", (95, 99)),
+    ("bytes=-500", (0, 99)),
+    ("bytes=100-", None),
+    ("bytes=10-5", None),
+    ("bytes=0-1,5-6", None),
+    ("items=0-9", None),
+    ("bytes=a-b", None),
+])
+def test_parse_byte_range(header, expected):
+    assert server.parse_byte_range(header, 100) == expected
@@ -0,0 +1,30 @@
+import asyncio
+import base64
+
+import pytest
+from fastapi import HTTPException
+
+pytest.importorskip("motor")
+import server
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(16)
+
+
+@pytest.mark.parametrize("data, expected", [
+    (PNG, "image/png"),
+    (b"\xff\xd8\xff\xe0" + bytes(16), "image/jpeg"),
+    (b"GIF89a" + bytes(16), "image/gif"),
+    (b"RIFF\x00\x00\x00\x00WEBPVP8 ", "image/webp"),
+    (b"<svg xmlns='http://www.w3.org/2000/svg'></svg>", None),
+    (b"<html><script>alert(1)</script></html>", None),
+])
+def test_sniff_image_type(data, expected):
+    assert server.sniff_image_type(data) == expected
+
+
+@pytest.mark.parametrize("declared", ["text/html", "image/svg+xml", "image/png"])
+def test_store_image_rejects_non_images_whatever_the_declared_type(declared):
+    value = f"data:{declared};base64," + base64.b64encode(b"<script>alert(1)</script>").decode()
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(server.store_image(value))
+    assert error.value.status_code == 400
@@ -0,0 +1,134 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from search_index import SearchIndex, document_terms, tokenize
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+NOW = datetime(2026, 3, 1)
+
+
+def make_index(**kwargs):
+    return SearchIndex(mongomock_motor.AsyncMongoMockClient()["test"], **kwargs)
+
+
+async def add_posts(index, contents, start, department="CSE", year=2):
+    ids = []
+    for offset, content in enumerate(contents):
+        post_id = f"post-{start + offset:04d}"
+        await index.index_post({
+            "id": post_id,
+            "content": content,
+            "created_at": NOW - timedelta(days=30) + timedelta(minutes=start + offset),
+            "user": {"department": department, "year": year}
+        })
+        ids.append(post_id)
+    return ids
+
+
+def test_tokenize_folds_case_and_accents():
+    assert tokenize("Café CAFE, café!") == ["cafe", "cafe", "cafe"]
+    assert document_terms("Exam prep", ["exam"]) == {"exam": 2, "prep": 1}
+
+
+def test_reindexing_a_post_is_a_no_op():
+    async def scenario():
+        index = make_index()
+        post = {"id": "p1", "content": "robotics club", "created_at": NOW, "user": {"department": "CSE", "year": 2}}
+        await index.index_post(post)
+        await index.index_post(post)
+        stats = await index.statistics()
+        assert (stats["documents"], stats["total_length"], stats["departments"]) == (1, 2, {"CSE": 1})
+        assert (await index._terms.find_one({"_id": "robotics"}))["df"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_search_requires_every_word_and_expands_the_last_one():
+    async def scenario():
+        index = make_index()
+        await add_posts(index, ["hackathon tonight", "exam hackathon", "exam results"], 0)
+        hits, _, _ = await index.search("exam hack")
+        assert [hit["post_id"] for hit in hits] == ["post-0001"]
+        hits, _, _ = await index.search("exam hack ")
+        assert hits == []
+
+    asyncio.run(scenario())
+
+
+def test_search_pages_resume_after_the_scan_cap():
+    async def scenario():
+        index = make_index(batch_size=5, max_scan=10)
+        old = await add_posts(index, ["alpha beta"] * 3, 0)
+        await add_posts(index, ["beta filler"] * 25, 10)
+
+        found, before, pages = [], None, 0
+        while pages < 20:
+            hits, _, resume_after = await index.search("alpha beta ", limit=2, before=before)
+            pages += 1
+            found += [hit["post_id"] for hit in hits]
+            if len(hits) == 2:
+                before = (hits[-1]["created_at"], hits[-1]["post_id"])
+            elif resume_after:
+                before = resume_after
+            else:
+                break
+        assert sorted(found) == old
+
+    asyncio.run(scenario())
+
+
+def test_rank_finds_rare_terms_behind_many_newer_common_ones():
+    async def scenario():
+        index = make_index(max_candidates=50)
+        old = await add_posts(index, ["exam hackathon"] * 3, 0)
+        await add_posts(index, [f"exam week {number}" for number in range(100)], 100)
+
+        hits, _, _ = await index.search("exam hackathon ")
+        assert sorted(hit["post_id"] for hit in hits) == old
+        hits, estimated_total = await index.rank("exam hackathon ", now=NOW)
+        assert sorted(hit["post_id"] for hit in hits) == old
+        assert estimated_total == 3
+
+    asyncio.run(scenario())
+
+
+def test_rank_prefers_more_relevant_posts_and_pages_after_a_position():
+    async def scenario():
+        index = make_index(half_life_days=0)
+        await add_posts(index, ["robotics robotics robotics", "robotics club meeting today", "robotics"], 0)
+        await add_posts(index, ["unrelated post"], 10)
+
+        hits, _ = await index.rank("robotics ", now=NOW, limit=2)
+        assert len(hits) == 2 and hits[0]["score"] >= hits[1]["score"]
+        rest, _ = await index.rank("robotics ", now=NOW, after=(hits[-1]["score"], hits[-1]["post_id"]))
+        assert {hit["post_id"] for hit in hits + rest} == {"post-0000", "post-0001", "post-0002"}
+        assert not {hit["post_id"] for hit in hits} & {hit["post_id"] for hit in rest}
+
+    asyncio.run(scenario())
+
+
+def test_filters_narrow_results_and_estimates():
+    async def scenario():
+        index = make_index()
+        await add_posts(index, ["robotics club"] * 2, 0, department="CSE")
+        await add_posts(index, ["robotics club"] * 3, 10, department="ECE")
+
+        hits, estimated_total, _ = await index.search("robotics ", department="ECE")
+        assert len(hits) == 3 and estimated_total == 3
+        hits, _ = await index.rank("robotics ", department="CSE", now=NOW)
+        assert len(hits) == 2
+
+    asyncio.run(scenario())
+
+
+def test_unknown_terms_match_nothing():
+    async def scenario():
+        index = make_index()
+        await add_posts(index, ["robotics club"], 0)
+        assert await index.search("nothing here ") == ([], 0, None)
+        assert await index.rank("nothing here ") == ([], 0)
+
+    asyncio.run(scenario())